@@ -19,6 +19,7 @@ fastapi_users = FastAPIUsers[User, uuid.UUID](get_user_manager, [auth_backend])
 
 current_active_user = fastapi_users.current_user(active=True)
 optional_user = fastapi_users.current_user(optional=True)
+current_superuser = fastapi_users.current_user(active=True, superuser=True)
 
 
 async def update_last_seen_user(
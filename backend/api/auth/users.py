@@ -7,9 +7,8 @@ from fastapi_users import BaseUserManager, UUIDIDMixin
 
 from api.auth.auth import SECRET
 from api.auth.models import User
-from api.realtime.actions import update_user as trigger_realtime_update
-
-import asyncio
+from api.realtime.actions import request_update
+from api.realtime.snapshots import invalidate_snapshot
 
 
 class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
@@ -37,10 +36,13 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     ):
         print(f"User {user.id} has been updated. Data changed: {update_dict.keys()}")
 
+        # Any profile field may be part of the cached realtime snapshot
+        await invalidate_snapshot(user.id)
+
         relevant_fields_for_bac = {"weight", "gender", "height", "dob", "display_name"}
         if not relevant_fields_for_bac.isdisjoint(update_dict.keys()):
             print(f"Relevant user details updated for {user.id}, triggering Redis publish.")
 
-            asyncio.create_task(trigger_realtime_update(user))
+            request_update(user)
         else:
             print(f"User {user.id} updated, but no BAC-relevant fields changed. Skipping update.")
\ No newline at end of file
@@ -26,3 +26,59 @@ MIN_HEIGHT = float(os.getenv("MIN_HEIGHT", "100"))
 MAX_HEIGHT = float(os.getenv("MAX_HEIGHT", "250"))
 MIN_AGE = int(os.getenv("MIN_AGE", "10"))
 MAX_AGE = int(os.getenv("MAX_AGE", "150"))
+
+# Number of users whose incremental BAC checkpoints are kept in memory per worker
+BAC_CHECKPOINT_CACHE_SIZE = int(os.getenv("BAC_CHECKPOINT_CACHE_SIZE", "10000"))
+
+# Number of validated body profiles cached per worker for BAC calculations
+BODY_PROFILE_CACHE_SIZE = int(os.getenv("BODY_PROFILE_CACHE_SIZE", "4096"))
+
+# Upper bound on the number of points a client can request per resampled BAC curve
+MAX_CURVE_POINTS = int(os.getenv("MAX_CURVE_POINTS", "2000"))
+
+# Seconds to wait for further changes to the same user before publishing one combined realtime update
+REALTIME_COALESCE_WINDOW = float(os.getenv("REALTIME_COALESCE_WINDOW", "0.25"))
+
+# Seconds between rebuilds of a group's aggregate after its members' updates; the aggregate is at most this stale
+REALTIME_AGGREGATE_INTERVAL = float(os.getenv("REALTIME_AGGREGATE_INTERVAL", "5"))
+
+# Seconds a user's realtime snapshot stays cached in Redis without being refreshed
+REALTIME_SNAPSHOT_TTL = int(os.getenv("REALTIME_SNAPSHOT_TTL", "86400"))
+
+# Seconds a worker building a snapshot holds a Redis lock on it, so other workers wait for it rather than
+# building the same one; 0 keeps coalescing within each worker only
+REALTIME_SNAPSHOT_LOCK_SECONDS = float(os.getenv("REALTIME_SNAPSHOT_LOCK_SECONDS", "0"))
+
+# Recent events kept per channel for reconnecting SSE clients to replay, and seconds an idle channel's log is kept
+REALTIME_REPLAY_LENGTH = int(os.getenv("REALTIME_REPLAY_LENGTH", "200"))
+REALTIME_REPLAY_TTL = int(os.getenv("REALTIME_REPLAY_TTL", "86400"))
+
+# Messages buffered per SSE connection before older updates are coalesced, and seconds a connection may sit
+# with a full buffer before it is disconnected as stuck
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "64"))
+SSE_SLOW_CONSUMER_TIMEOUT = float(os.getenv("SSE_SLOW_CONSUMER_TIMEOUT", "30"))
+
+# Seconds a channel counts as watched after a worker last reported an open stream on it; workers report
+# every third of this
+REALTIME_PRESENCE_TTL = int(os.getenv("REALTIME_PRESENCE_TTL", "30"))
+
+# Most members returned per page of full member detail
+REALTIME_MEMBER_PAGE_SIZE = int(os.getenv("REALTIME_MEMBER_PAGE_SIZE", "100"))
+
+# Background work (realtime updates, archival checks) run concurrently per worker, and how many jobs may wait
+WORK_QUEUE_WORKERS = int(os.getenv("WORK_QUEUE_WORKERS", "8"))
+WORK_QUEUE_MAX_DEPTH = int(os.getenv("WORK_QUEUE_MAX_DEPTH", "10000"))
+
+# Where CPU-heavy BAC computation for many members runs: "process" or "thread" pools, or "inline" on the event loop.
+# Work for at most COMPUTE_INLINE_MEMBERS members always runs inline, larger batches go to the pool in chunks.
+COMPUTE_EXECUTOR = os.getenv("COMPUTE_EXECUTOR", "process")
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", str(min(4, os.cpu_count() or 1))))
+COMPUTE_INLINE_MEMBERS = int(os.getenv("COMPUTE_INLINE_MEMBERS", "20"))
+COMPUTE_CHUNK_MEMBERS = int(os.getenv("COMPUTE_CHUNK_MEMBERS", "100"))
+
+# New realtime streams each worker accepts per second, and the burst it absorbs above that rate
+SSE_ADMISSION_RATE = float(os.getenv("SSE_ADMISSION_RATE", "50"))
+SSE_ADMISSION_BURST = int(os.getenv("SSE_ADMISSION_BURST", "200"))
+
+# Base reconnect delay in milliseconds sent to SSE clients, jittered and stretched when the worker is busy
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
@@ -0,0 +1,77 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Sequence
+
+from api.config import COMPUTE_CHUNK_MEMBERS, COMPUTE_EXECUTOR, COMPUTE_INLINE_MEMBERS, COMPUTE_WORKERS
+
+
+class ComputePool:
+    """
+    Runs CPU-heavy BAC work for many members off the event loop, so building a big group's snapshot doesn't stall
+    every other request and stream on the worker.
+
+    Functions given to the pool must be module-level and take and return picklable values, since a process pool
+    runs them in child processes. The pool is created on first use.
+    """
+
+    def __init__(self, kind: str = COMPUTE_EXECUTOR, workers: int = COMPUTE_WORKERS,
+                 inline_items: int = COMPUTE_INLINE_MEMBERS, chunk_size: int = COMPUTE_CHUNK_MEMBERS):
+        """
+        :param kind: "process", "thread" or "inline".
+        :param workers: Pool size.
+        :param inline_items: Largest batch still computed inline, where a pool round trip costs more than it saves.
+        :param chunk_size: Items per job when a batch is split across the pool.
+        """
+
+        assert kind in ("process", "thread", "inline"), f"Unknown compute executor {kind!r}!"
+
+        self.kind = kind
+        self.workers = workers
+        self.inline_items = inline_items
+        self.chunk_size = chunk_size
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # Spawned rather than forked, so children don't inherit the event loop or open connections
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="compute")
+        return self._executor
+
+    async def run(self, func: Callable, *args, size: int = 0) -> Any:
+        """
+        Run func(*args) in the pool, or inline when the pool is disabled or the work covers at most
+        `inline_items` items.
+        """
+        if self.kind == "inline" or size <= self.inline_items:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+
+    async def map_chunks(self, func: Callable[..., list], *columns: Sequence) -> list:
+        """
+        Apply func to parallel columns of per-item arguments, e.g. each member's drinks and body data, in chunks of
+        `chunk_size` items spread across the pool.
+        :return: The concatenation of func's results, in item order.
+        """
+        n = len(columns[0])
+        if self.kind == "inline" or n <= self.inline_items:
+            return func(*columns)
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(executor, func, *(column[i:i + self.chunk_size] for column in columns))
+            for i in range(0, n, self.chunk_size)
+        ))
+        return [item for chunk in chunks for item in chunk]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+
+compute_pool = ComputePool()
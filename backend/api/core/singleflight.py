@@ -0,0 +1,67 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, Iterable, Optional
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical work in this process: callers asking for a key that is already being computed
+    wait for that computation instead of starting their own.
+    """
+
+    def __init__(self):
+        self._flights: dict[Hashable, asyncio.Future] = {}
+        self._led = 0
+        self._shared = 0
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Await func(*args, **kwargs), or the result of the call already in flight for the same key.
+        The call runs as its own task, so it completes for the other callers even if the first one is cancelled.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(func(*args, **kwargs))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda _: self._flights.pop(key, None))
+            self._led += 1
+        else:
+            self._shared += 1
+        return await asyncio.shield(flight)
+
+    def claim(self, keys: Iterable[Hashable]) -> tuple[list, dict[Hashable, asyncio.Future]]:
+        """
+        For work done in batches: take the lead on every key not yet in flight, and get the flights of the rest.
+        The caller must settle the keys it leads.
+        :return: The keys led, and the in-flight futures of the others.
+        """
+        led, following = [], {}
+        for key in keys:
+            flight = self._flights.get(key)
+            if flight is None:
+                self._flights[key] = asyncio.get_running_loop().create_future()
+                led.append(key)
+            else:
+                following[key] = flight
+        self._led += len(led)
+        self._shared += len(following)
+        return led, following
+
+    def settle(self, keys: Iterable[Hashable], results: dict):
+        """Hand out the results of led keys. Keys without one are cancelled, leaving followers to do them."""
+        for key in keys:
+            flight = self._flights.pop(key)
+            if key in results:
+                flight.set_result(results[key])
+            else:
+                flight.cancel()
+
+    @staticmethod
+    async def follow(flight: asyncio.Future) -> Optional[Any]:
+        """The result of a claimed flight, or None if its leader failed or was cancelled."""
+        await asyncio.wait({flight})
+        if flight.cancelled() or flight.exception() is not None:
+            return None
+        return flight.result()
+
+    def metrics(self) -> dict:
+        return {"inFlight": len(self._flights), "led": self._led, "shared": self._shared}
@@ -0,0 +1,198 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+
+from api.config import WORK_QUEUE_MAX_DEPTH, WORK_QUEUE_WORKERS
+
+
+class _Job:
+    __slots__ = ("kind", "func", "args", "ready_at", "submitted_at")
+
+    def __init__(self, kind: str, func: Callable[..., Awaitable[Any]], args: tuple, ready_at: float):
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.ready_at = ready_at
+        self.submitted_at = time.monotonic()
+
+
+class WorkQueue:
+    """
+    Bounded background executor for work triggered by requests, such as realtime updates and archival checks.
+
+    Jobs are grouped by a key (a user ID) and each key's jobs run one at a time in submission order, so two
+    updates for the same user can never publish out of order. A fixed pool of workers bounds how many keys run
+    at once. A job that hasn't started yet absorbs later submissions of the same kind for its key, taking their
+    arguments, so bursts collapse into one run with the latest data. At most `max_depth` jobs wait at once;
+    beyond that new work is rejected.
+    """
+
+    def __init__(self, workers: int = WORK_QUEUE_WORKERS, max_depth: int = WORK_QUEUE_MAX_DEPTH):
+        """
+        :param workers: Number of jobs run concurrently.
+        :param max_depth: Maximum number of jobs waiting to run.
+        """
+
+        assert workers > 0, "A work queue needs at least one worker!"
+
+        self.workers = workers
+        self.max_depth = max_depth
+        self._jobs: dict[Hashable, deque[_Job]] = {}
+        self._ready: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._running: set[Hashable] = set()
+        self._timers: set[asyncio.TimerHandle] = set()
+        self._depth = 0
+        self._stats = {
+            "submitted": 0, "coalesced": 0, "rejected": 0, "completed": 0, "failed": 0,
+            "wait_seconds_total": 0.0, "wait_seconds_max": 0.0,
+        }
+
+    def start(self):
+        """Start the workers on the running event loop."""
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        # Work submitted before the queue started
+        for key in list(self._jobs):
+            self._schedule(key)
+
+    async def drain(self, timeout: float = 10.0):
+        """
+        Run everything already queued without waiting out delays, then stop the workers.
+        Jobs still unfinished after `timeout` seconds are cancelled.
+        """
+
+        if not self._tasks:
+            return
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        for jobs in self._jobs.values():
+            for job in jobs:
+                job.ready_at = 0.0
+        for key in self._jobs:
+            if key not in self._running:
+                self._ready.put_nowait(key)
+
+        deadline = time.monotonic() + timeout
+        while (self._depth or self._running) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._ready = None
+
+    def submit(self, key: Hashable, kind: str, func: Callable[..., Awaitable[Any]], *args,
+               delay: float = 0.0) -> bool:
+        """
+        Queue `func(*args)` to run after `delay` seconds, after any earlier work for the same key.
+        :param key: Jobs with the same key run one at a time, in order.
+        :param kind: A job of this kind and key that hasn't started yet takes these arguments instead.
+        :return: False if the queue is full and the job was rejected.
+        """
+
+        jobs = self._jobs.get(key)
+        if jobs:
+            # The first job of a running key has already started
+            pending = list(jobs)[1:] if key in self._running else jobs
+            for job in pending:
+                if job.kind == kind:
+                    job.func, job.args = func, args
+                    self._stats["coalesced"] += 1
+                    return True
+
+        if self._depth >= self.max_depth:
+            self._stats["rejected"] += 1
+            print(f"Work queue full ({self._depth} jobs), rejected {kind} for {key}")
+            return False
+
+        job = _Job(kind, func, args, time.monotonic() + delay)
+        self._depth += 1
+        self._stats["submitted"] += 1
+        if jobs:
+            jobs.append(job)
+        else:
+            self._jobs[key] = deque([job])
+            self._schedule(key)
+        return True
+
+    async def submit_when_room(self, key: Hashable, kind: str, func: Callable[..., Awaitable[Any]], *args,
+                               delay: float = 0.0):
+        """
+        Like submit, but waits for room in the queue rather than rejecting the job, for bulk work such as the
+        archival checks queued at startup. The queue must have been started.
+        """
+        await self.wait_for_room()
+        self.submit(key, kind, func, *args, delay=delay)
+
+    async def wait_for_room(self):
+        """Wait until the queue has room for another job."""
+        while self._depth >= self.max_depth:
+            await asyncio.sleep(0.05)
+
+    def _schedule(self, key: Hashable):
+        """Hand a key that has no job running to the workers, once its next job is due."""
+        if self._ready is None:
+            return
+        wait = self._jobs[key][0].ready_at - time.monotonic()
+        if wait <= 0:
+            self._ready.put_nowait(key)
+            return
+
+        def ready():
+            self._timers.discard(timer)
+            if self._ready is not None:
+                self._ready.put_nowait(key)
+
+        timer = asyncio.get_running_loop().call_later(wait, ready)
+        self._timers.add(timer)
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            jobs = self._jobs.get(key)
+            if not jobs or key in self._running:
+                continue
+
+            job = jobs[0]
+            self._running.add(key)
+            self._depth -= 1
+            wait = time.monotonic() - max(job.ready_at, job.submitted_at)
+            self._stats["wait_seconds_total"] += max(0.0, wait)
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], wait)
+            try:
+                await job.func(*job.args)
+                self._stats["completed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["failed"] += 1
+                print(f"Work queue job {job.kind} for {key} failed: {e!r}")
+            finally:
+                self._running.discard(key)
+                jobs.popleft()
+                if jobs:
+                    self._schedule(key)
+                else:
+                    del self._jobs[key]
+
+    def metrics(self) -> dict:
+        """Current depth and lifetime counters, including how long jobs waited past their due time."""
+        started = self._stats["completed"] + self._stats["failed"] + len(self._running)
+        return {
+            "workers": self.workers, "maxDepth": self.max_depth,
+            "depth": self._depth, "running": len(self._running),
+            "submitted": self._stats["submitted"], "coalesced": self._stats["coalesced"],
+            "rejected": self._stats["rejected"], "completed": self._stats["completed"],
+            "failed": self._stats["failed"],
+            "waitSecondsAvg": self._stats["wait_seconds_total"] / started if started else 0.0,
+            "waitSecondsMax": self._stats["wait_seconds_max"],
+        }
+
+
+work_queue = WorkQueue()
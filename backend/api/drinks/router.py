@@ -1,5 +1,3 @@
-import asyncio
-
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -9,8 +7,10 @@ from api.auth.deps import update_last_seen_user
 from api.drinks.models import Drink
 from api.drinks.schemas import DrinkCreate, DrinkRead
 from api.core.db import get_async_session
+from api.core.work_queue import work_queue
 from api.auth.models import User
-from api.realtime.actions import update_user
+from api.realtime.actions import request_update
+from api.realtime.snapshots import invalidate_snapshot
 from api.realtime.scheduler import update_archival
 
 router = APIRouter()
@@ -27,8 +27,9 @@ async def create_drink(
     session.add(db_drink)
     await session.commit()
     await session.refresh(db_drink)
-    asyncio.create_task(update_archival(user.id))
-    asyncio.create_task(update_user(user))
+    await invalidate_snapshot(user.id)
+    work_queue.submit(user.id, "archival", update_archival, user.id)
+    request_update(user)
     return db_drink
 
 
@@ -50,8 +51,9 @@ async def delete_last_drink(
 
     await session.delete(last_drink)
     await session.commit()
-    asyncio.create_task(update_archival(user.id))
-    asyncio.create_task(update_user(user))
+    await invalidate_snapshot(user.id)
+    work_queue.submit(user.id, "archival", update_archival, user.id)
+    request_update(user)
     return last_drink
 
 
@@ -84,8 +86,9 @@ async def update_drink(
 
     await session.commit()
     await session.refresh(db_drink)
-    asyncio.create_task(update_archival(user.id))
-    asyncio.create_task(update_user(user))
+    await invalidate_snapshot(user.id)
+    work_queue.submit(user.id, "archival", update_archival, user.id)
+    request_update(user)
     return db_drink
 
 
@@ -101,6 +104,7 @@ async def delete_drink(
 
     await session.delete(db_drink)
     await session.commit()
-    asyncio.create_task(update_archival(user.id))
-    asyncio.create_task(update_user(user))
+    await invalidate_snapshot(user.id)
+    work_queue.submit(user.id, "archival", update_archival, user.id)
+    request_update(user)
     return db_drink
@@ -1,4 +1,3 @@
-import asyncio
 import uuid
 
 from fastapi import APIRouter, Depends, HTTPException
@@ -17,7 +16,7 @@ from api.auth.models import User
 
 from fastapi import Query
 
-from api.realtime.actions import update_user
+from api.realtime.actions import move_subscription, request_update
 
 router = APIRouter()
 
@@ -63,7 +62,8 @@ async def create_group(
         await session.rollback()
         raise HTTPException(status_code=409, detail="Group name already taken!")
 
-    asyncio.create_task(update_user(user))
+    await move_subscription(user.id, group.id)
+    request_update(user)
 
     return group
 
@@ -101,7 +101,8 @@ async def switch_group(
         group = group_result.scalar_one_or_none()
 
     await session.commit()
-    asyncio.create_task(update_user(user))
+    await move_subscription(user.id, group_id)
+    request_update(user)
     return group
 
 
@@ -192,7 +193,8 @@ async def join_group_public(
     session.add(user_group)
     await session.commit()
 
-    asyncio.create_task(update_user(user))
+    await move_subscription(user.id, group_id)
+    request_update(user)
     return group
 
 
@@ -238,7 +240,8 @@ async def join_group(
         session.add(UserGroup(user_id=user.id, group_id=group_id, active=True))
 
     await session.commit()
-    asyncio.create_task(update_user(user))
+    await move_subscription(user.id, group_id)
+    request_update(user)
     return group
 
 
@@ -297,15 +300,25 @@ async def leave_group(
         raise HTTPException(status_code=404, detail="Group not found.")
 
     if group.owner_id == user.id:
+        members_result = await session.execute(
+            select(UserGroup.user_id).where(UserGroup.group_id == group_id, UserGroup.active == True)
+        )
+        active_member_ids = members_result.scalars().all()
+
         await session.execute(delete(UserGroup).where(UserGroup.group_id == group_id))
         await session.execute(delete(Group).where(Group.id == group_id))
         await session.commit()
+        for member_id in active_member_ids:
+            await move_subscription(member_id, None)
         # No group to update anymore, but we can notify the user they are solo
-        asyncio.create_task(update_user(user))
+        request_update(user)
         return {"detail": "Deleted group."}
 
+    was_active = user_group.active
     await session.delete(user_group)
     await session.commit()
 
-    asyncio.create_task(update_user(user))
+    if was_active:
+        await move_subscription(user.id, None)
+    request_update(user)
     return {"detail": "Left group."}
\ No newline at end of file
@@ -6,28 +6,43 @@ from api.core.db import create_db_and_tables
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 from contextlib import asynccontextmanager
 from sqlalchemy import select
 from api.core.db import get_async_session
 from api.drinks.models import Drink
+from api.core.compute import compute_pool
+from api.core.work_queue import work_queue
+from api.realtime.hub import hub
 from api.realtime.scheduler import update_archival
-import asyncio
-
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    await create_db_and_tables()
 
+async def queue_archival_checks():
     # Update archival for all users, important to do this on startup for if server went down
     async for session in get_async_session():
         result = await session.execute(select(Drink.user_id).distinct())
         user_ids = result.scalars().all()
 
-        for user_id in user_ids:
-            asyncio.create_task(update_archival(user_id))
+    # There can be more users than the queue holds, so they are queued as it makes room
+    for user_id in user_ids:
+        await work_queue.submit_when_room(user_id, "archival", update_archival, user_id)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await create_db_and_tables()
+    work_queue.start()
+    archival_checks = asyncio.create_task(queue_archival_checks())
 
     yield
 
+    # Let queued updates and archival checks finish before the worker exits
+    archival_checks.cancel()
+    await asyncio.gather(archival_checks, return_exceptions=True)
+    await work_queue.drain()
+    await hub.close()
+    compute_pool.shutdown()
+
 app = FastAPI(lifespan=lifespan, redirect_slashes=False)
 
 app.include_router(auth_router, prefix="/auth")
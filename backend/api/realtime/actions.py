@@ -1,22 +1,145 @@
+import asyncio
 import json
-from datetime import datetime, timezone
-from typing import List
-
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+from uuid import UUID
 
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 
 from api.auth.models import User
+from api.config import BAC_CHECKPOINT_CACHE_SIZE, REALTIME_AGGREGATE_INTERVAL, REALTIME_COALESCE_WINDOW
+from api.core.compute import compute_pool
 from api.core.db import redis_client, get_async_session
+from api.core.singleflight import SingleFlight
+from api.core.work_queue import work_queue
 from api.drinks.models import Drink
 from api.group.models import Group, UserGroup
-from api.realtime.calculations import drinks_to_bac
+from api.realtime.aggregate import aggregate_states
+from api.realtime.events import publish_event, skip_event
+from api.realtime.incremental import get_checkpoint
+from api.realtime.presence import is_watched
+from api.realtime.snapshots import load_snapshots, store_snapshot, user_profile, version_key
+from api.utils import bac_user_data
+
+
+def personal_channel(user_id: UUID) -> str:
+    """Redis channel for messages to one user's streams."""
+    return f"sse:{user_id}"
+
+
+def group_channel(group_id: UUID) -> str:
+    """Redis channel for updates shared by every active member of a group."""
+    return f"sse:group:{group_id}"
+
+
+async def move_subscription(user_id: UUID, group_id: Optional[UUID]):
+    """
+    Tell a user's open streams to follow them to another group's channel, or to no group channel at all.
+    Must be published before the user's next update so their streams are listening when it arrives.
+    """
+    message = {"type": "subscribe", "group_id": str(group_id) if group_id else None}
+    await redis_client.publish(personal_channel(user_id), json.dumps(message))
+
+
+async def group_aggregate(session, group: Group) -> dict:
+    """Aggregate BAC curves (max, mean, count over the limit) across the active members of a group."""
+    members_result = await session.execute(
+        select(UserGroup)
+        .options(selectinload(UserGroup.user))
+        .where(UserGroup.group_id == group.id, UserGroup.active.is_(True))
+    )
+    members = [ug.user for ug in members_result.scalars().unique().all() if ug.user]
+
+    snapshots = await load_snapshots(session, members, group)
+    return await shared_aggregate(group, members, snapshots)
+
+
+# Group aggregates being computed in this worker, by group and member versions
+aggregate_flights = SingleFlight()
+
+
+async def shared_aggregate(group: Group, members: List[User], snapshots: dict[UUID, dict]) -> dict:
+    """
+    The aggregate of the members' snapshots, computed once for concurrent callers that see the same members
+    at the same versions, such as a group reconnecting at once or several members' updates in a row.
+    """
+    key = (group.id, frozenset((m.id, snapshots[m.id]["version"]) for m in members))
+    states = [snapshots[m.id]["states"] for m in members]
+    return await aggregate_flights.do(key, compute_pool.run, aggregate_states, states, size=len(states))
+
+
+async def build_snapshot(session, user: User, group: Optional[Group]) -> dict:
+    """A user's full realtime snapshot: their profile, live drinks and BAC states."""
+    drinks_result = await session.execute(
+        select(Drink).where(Drink.user_id == user.id).order_by(Drink.add_time.asc())
+    )
+    user_drinks = drinks_result.scalars().all()
+    formatted_drinks = [
+        {"id": str(d.id), "nickname": d.nickname, "volume": d.volume,
+         "strength": d.strength, "time": d.add_time} for d in user_drinks
+    ]
+
+    # Only the drinks after the first change are recomputed
+    checkpoint = get_checkpoint(user.id, bac_user_data(user))
+    checkpoint.sync(formatted_drinks)
+    calculated_states = checkpoint.timeline().to_payload()
+
+    return {"profile": user_profile(user, group), "drinks": formatted_drinks, "states": calculated_states}
+
+
+def delta_message(user_id: UUID, version: int, old: dict, new: dict) -> dict:
+    """
+    The changes between two consecutive snapshots of a user: the drinks added, edited or removed, and the states
+    from the first one that changed. Clients drop their states at or after `states_since` and append `states`.
+    """
+
+    old_drinks = {d["id"]: d for d in old["drinks"]}
+    new_ids = {d["id"] for d in new["drinks"]}
+
+    old_states, new_states = old["states"], new["states"]
+    index = next(
+        (i for i, (a, b) in enumerate(zip(old_states, new_states)) if a != b),
+        min(len(old_states), len(new_states)),
+    )
+
+    def first_time(i):
+        # The earlier of the two states, so old states from a drink moved later are dropped too
+        times = [states[i]["time"] for states in (old_states, new_states) if i < len(states)]
+        return min(times) if times else None
+
+    since = first_time(index)
+    # Clients keep the states before `since`, so the unchanged states at that time (such as the other half of a
+    # drink's step) are sent again
+    while since is not None and index > 0 and new_states[index - 1]["time"] >= since:
+        index -= 1
+        since = first_time(index)
+
+    return {
+        "type": "delta", "user_id_updated": str(user_id), "version": version, "base_version": version - 1,
+        "drinks_upserted": [d for d in new["drinks"] if old_drinks.get(d["id"]) != d],
+        "drinks_removed": [i for i in old_drinks if i not in new_ids],
+        "states_since": since, "states": new_states[index:],
+    }
+
+
+# Last snapshot this worker published per user, which the next update is diffed against
+_published: OrderedDict[UUID, tuple[int, dict]] = OrderedDict()
 
 
 async def update_user(user: User):
     """
-    Constructs a comprehensive update package and publishes it to the Redis
-    channel of every user affected by the change (e.g., all members of a group).
+    Constructs an update package and publishes it once to the Redis channel of
+    the user's active group, or to their own channel if they are solo. Nothing is
+    published while no stream is watching that channel.
+
+    When this worker published the user's previous version it sends a delta
+    against it, otherwise the full snapshot.
+
+    Only run through the work queue (see request_update), which runs one update
+    per user at a time and folds repeated requests into the next run, so this
+    worker never reloads the same user twice at once. Updates for the same user
+    on different workers are not coalesced, each reloads from Postgres.
     """
     async for session in get_async_session():
 
@@ -31,50 +154,76 @@ async def update_user(user: User):
         user_group = ug_result.scalars().first()
         group = user_group.group if user_group else None
 
-        profile_data = {
-            "id": str(user.id), "displayName": user.display_name, "email": user.email,
-            "weight": user.weight, "gender": user.gender, "height": user.height,
-            "dob": user.dob.isoformat() if user.dob else None, "realDob": user.real_dob,
-            "isOwner": (group and group.owner_id == user.id) if group else False, "active": True,
-        }
+        snapshot = await build_snapshot(session, user, group)
+        version = await redis_client.incr(version_key(user.id))
+        await store_snapshot(user.id, version, snapshot)
 
-        drinks_result = await session.execute(
-            select(Drink).where(Drink.user_id == user.id).order_by(Drink.add_time.asc())
-        )
-        user_drinks = drinks_result.scalars().all()
-        formatted_drinks = [
-            {"id": str(d.id), "nickname": d.nickname, "volume": d.volume,
-             "strength": d.strength, "time": d.add_time} for d in user_drinks
-        ]
-
-        age = (datetime.now(timezone.utc).date() - user.dob).days / 365.25
-        user_data_for_bac = {"weight": user.weight, "gender": user.gender, "height": user.height, "age": age}
-        calculated_states = drinks_to_bac(formatted_drinks, user_data_for_bac)
-
-        update_message = {
-            "type": "update", "user_id_updated": str(user.id),
-            "profile": profile_data, "drinks": formatted_drinks, "states": calculated_states,
-        }
-
-        users_to_notify_ids = []
-        if group:
-            user_group_entries = await session.execute(
-                select(UserGroup.user_id).where(
-                    UserGroup.group_id == group.id,
-                    UserGroup.active == True
-                )
-            )
-            users_to_notify_ids = user_group_entries.scalars().unique().all()
+        # Every member's stream listens on the group channel, so one publish reaches the whole group
+        channel = group_channel(group.id) if group else personal_channel(user.id)
+        if not await is_watched(channel):
+            # Nobody has a stream open; the stored snapshot serves their next initial-state
+            await skip_event(channel)
+            print(f"Skipped update for unwatched Redis channel: {channel}")
+            return
+
+        previous = _published.get(user.id)
+        if previous and previous[0] == version - 1 and previous[1]["profile"] == snapshot["profile"]:
+            update_message = delta_message(user.id, version, previous[1], snapshot)
         else:
-            # If the user is solo, only notify them.
-            users_to_notify_ids = [user.id]
+            update_message = {"type": "update", "user_id_updated": str(user.id), "version": version, **snapshot}
+
+        _published[user.id] = (version, snapshot)
+        _published.move_to_end(user.id)
+        while len(_published) > BAC_CHECKPOINT_CACHE_SIZE:
+            _published.popitem(last=False)
 
-        if not users_to_notify_ids:
-            print(f"Update for user {user.id} occurred, but no active users found to notify.")
+        await publish_event(channel, json.dumps(update_message, default=str))
+        print(f"Published update to Redis channel: {channel}")
+
+    if group:
+        # Rebuilding it loads every member's snapshot, so it is throttled per group rather than redone per update
+        work_queue.submit(
+            ("aggregate", group.id), "aggregate", publish_group_aggregate, group.id, delay=REALTIME_AGGREGATE_INTERVAL,
+        )
+
+
+async def publish_group_aggregate(group_id: UUID):
+    """Publish a group's current aggregate to its channel, for streams that asked for aggregates."""
+    channel = group_channel(group_id)
+    if not await is_watched(channel):
+        return
+    async for session in get_async_session():
+        group = await session.get(Group, group_id)
+        if group is None:
             return
+        aggregate = await group_aggregate(session, group)
+    await publish_event(channel, json.dumps({"type": "group", "group_id": str(group_id), "aggregate": aggregate}))
+
+
+def request_update(user: User):
+    """
+    Schedule a realtime update for a user, coalescing bursts of changes into one publish.
+
+    The update runs REALTIME_COALESCE_WINDOW seconds after the first request, with the most recent user
+    object. Requests arriving while an update is being built queue one more update behind it, so the final
+    state is always published, and a user's updates never run concurrently. While the work queue is full the
+    latest user object is held back, and scheduled once the queue has room.
+    """
+    if work_queue.submit(user.id, "update", update_user, user, delay=REALTIME_COALESCE_WINDOW):
+        return
+    if user.id not in _deferred_updates:
+        task = asyncio.create_task(_submit_deferred_update(user.id))
+        _deferred_tasks.add(task)
+        task.add_done_callback(_deferred_tasks.discard)
+    _deferred_updates[user.id] = user
+
+
+# Latest user object of each update the full work queue rejected, and the tasks waiting to resubmit them
+_deferred_updates: Dict[UUID, User] = {}
+_deferred_tasks: Set[asyncio.Task] = set()
+
 
-        update_message_json = json.dumps(update_message, default=str)
-        for target_user_id in users_to_notify_ids:
-            channel = f"sse:{target_user_id}"
-            await redis_client.publish(channel, update_message_json)
-            print(f"Published update to Redis channel: {channel}")
\ No newline at end of file
+async def _submit_deferred_update(user_id: UUID):
+    await work_queue.wait_for_room()
+    # Rejected again if the room has been taken in the meantime, deferring it once more
+    request_update(_deferred_updates.pop(user_id))
@@ -0,0 +1,98 @@
+import math
+import random
+import time
+from collections import deque
+
+from api.config import SSE_ADMISSION_BURST, SSE_ADMISSION_RATE, SSE_RETRY_MS
+
+# Seconds of history behind the connection rate metrics
+RATE_WINDOW = 60
+
+
+class StreamAdmission:
+    """
+    Per-worker admission control for new realtime streams, so a reconnect storm after a restart is spread out
+    rather than hitting token checks, the database and Redis all at once.
+
+    A token bucket admits `rate` streams per second with bursts of up to `burst`. Refused clients are told to come
+    back after a random delay spread over the time the current backlog takes to admit, and admitted SSE clients
+    get a jittered reconnect delay that grows as the bucket empties.
+    """
+
+    def __init__(self, rate: float = SSE_ADMISSION_RATE, burst: int = SSE_ADMISSION_BURST,
+                 retry_ms: int = SSE_RETRY_MS):
+        """
+        :param rate: Streams admitted per second.
+        :param burst: Bucket size.
+        :param retry_ms: Base SSE reconnect delay in milliseconds.
+        """
+
+        assert rate > 0 and burst >= 1, "Admission needs a positive rate and a burst of at least one!"
+
+        self.rate = rate
+        self.burst = burst
+        self.retry_ms = retry_ms
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._accepted = 0
+        self._rejected = 0
+        # [second, accepted, rejected] per second over the last RATE_WINDOW seconds
+        self._window: deque[list] = deque()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _prune(self, second: int):
+        while self._window and self._window[0][0] <= second - RATE_WINDOW:
+            self._window.popleft()
+
+    def _count(self, now: float, accepted: bool):
+        second = int(now)
+        self._prune(second)
+        if not self._window or self._window[-1][0] != second:
+            self._window.append([second, 0, 0])
+        self._window[-1][1 if accepted else 2] += 1
+
+    def admit(self) -> bool:
+        """Take a token for a new stream, or refuse it if the bucket is empty."""
+        now = time.monotonic()
+        self._refill(now)
+        accepted = self._tokens >= 1
+        if accepted:
+            self._tokens -= 1
+            self._accepted += 1
+        else:
+            self._rejected += 1
+        self._count(now, accepted)
+        return accepted
+
+    def _recent(self, column: int) -> float:
+        """Per-second rate over the window."""
+        second = int(time.monotonic())
+        self._prune(second)
+        if not self._window:
+            return 0.0
+        span = second - self._window[0][0] + 1
+        return sum(entry[column] for entry in self._window) / span
+
+    def retry_after(self) -> int:
+        """Seconds a refused client should wait, spread over the time it takes to admit everyone being refused."""
+        backlog_seconds = self._recent(2) / self.rate
+        return math.ceil(random.uniform(1, 1 + backlog_seconds))
+
+    def retry_delay_ms(self) -> int:
+        """SSE reconnect delay for an admitted client: the base delay jittered by ±50%, longer while tokens are low."""
+        self._refill(time.monotonic())
+        pressure = 1 - self._tokens / self.burst
+        return round(self.retry_ms * random.uniform(0.5, 1.5) * (1 + 4 * pressure))
+
+    def metrics(self) -> dict:
+        return {
+            "rate": self.rate, "burst": self.burst, "tokens": round(self._tokens, 2),
+            "accepted": self._accepted, "rejected": self._rejected,
+            "acceptedPerSecond": round(self._recent(1), 2), "rejectedPerSecond": round(self._recent(2), 2),
+        }
+
+
+stream_admission = StreamAdmission()
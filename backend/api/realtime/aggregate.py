@@ -0,0 +1,150 @@
+import heapq
+from datetime import datetime
+
+import numpy as np
+
+from api.realtime.calculations import DEFAULT_METABOLISM_RATE
+from api.realtime.timeline import BACTimeline, LEGAL_LIMIT
+
+
+def _member_events(member: int, timeline: BACTimeline, threshold: float):
+    """
+    One member's events in time order: every breakpoint, plus the moments the BAC declines through the threshold.
+    Events are (time, member, breakpoint index) with index -1 for a threshold crossing.
+    """
+
+    times, bacs = timeline.times.tolist(), timeline.bacs.tolist()
+    for i, (t, bac) in enumerate(zip(times, bacs)):
+        yield t, member, i
+        if i + 1 < len(times) and bac >= threshold > bacs[i + 1]:
+            yield t + (times[i + 1] - t) * (bac - threshold) / (bac - bacs[i + 1]), member, -1
+
+
+def aggregate_timelines(timelines: list[BACTimeline], threshold: float = LEGAL_LIMIT,
+                        metabolism_rate: float = DEFAULT_METABOLISM_RATE) -> dict[str, np.ndarray]:
+    """
+    Group-level curves over the members' timelines: the highest BAC, the mean BAC and the number of members at or
+    over a threshold, at every moment any of them changes.
+
+    The members' sorted breakpoints are k-way merged and consumed in a single pass. Between breakpoints every
+    member's BAC is flat at zero or declining at the shared metabolism rate, so the sum and slope of all BACs are
+    updated per event and the highest BAC is the top of a heap keyed by where each member's decline started.
+    Where a drink makes a curve step, both the value before and after the step are included.
+
+    :param timelines: One timeline per member, all computed with the same metabolism rate.
+    :param threshold: BAC threshold for the over-the-limit count.
+    :param metabolism_rate: Metabolism rate the timelines were computed with, in g/(dL * hr).
+    :return: Dictionary of equal length arrays 'times' (epoch seconds), 'max', 'mean' and 'over'.
+    """
+
+    rate = metabolism_rate / 3600
+    n = len(timelines)
+    data = [(t.times.tolist(), t.bacs.tolist()) for t in timelines]
+
+    # Per member: value and slope of the current segment, and when it started
+    value = [0.0] * n
+    slope = [0.0] * n
+    since = [0.0] * n
+    over = [False] * n
+    version = [0] * n
+    total, total_slope, total_time = 0.0, 0.0, None
+    count_over = 0
+    heap = []
+
+    out_times, out_max, out_mean, out_over = [], [], [], []
+
+    def highest(t):
+        while heap and heap[0][2] != version[heap[0][1]]:
+            heapq.heappop(heap)
+        return max(0.0, -heap[0][0] - rate * t) if heap else 0.0
+
+    def record(t):
+        out_times.append(t)
+        out_max.append(highest(t))
+        out_mean.append(max(0.0, total / n))
+        out_over.append(count_over)
+
+    events = heapq.merge(*(_member_events(m, t, threshold) for m, t in enumerate(timelines)))
+    current = None
+    for t, member, i in events:
+        if t != current:
+            if current is not None:
+                record(current)
+            if total_time is not None:
+                total += total_slope * (t - total_time)
+            total_time = t
+            current = t
+            record(t)
+
+        if i < 0:
+            count_over -= 1
+            over[member] = False
+            continue
+
+        times, bacs = data[member]
+        new_value = bacs[i]
+        new_slope = (bacs[i + 1] - new_value) / (times[i + 1] - t) if i + 1 < len(times) and times[i + 1] > t else 0.0
+
+        total += new_value - (value[member] + slope[member] * (t - since[member]))
+        total_slope += new_slope - slope[member]
+        value[member], slope[member], since[member] = new_value, new_slope, t
+
+        version[member] += 1
+        if new_value > 0:
+            heapq.heappush(heap, (-(new_value + rate * t), member, version[member]))
+
+        is_over = new_value >= threshold
+        count_over += is_over - over[member]
+        over[member] = is_over
+
+    if current is not None:
+        record(current)
+
+    # Drop the duplicate records of events that didn't change anything
+    times = np.array(out_times)
+    columns = np.array([out_max, out_mean, out_over], dtype=np.float64)
+    keep = np.ones(len(times), dtype=bool)
+    if len(times) > 1:
+        keep[1:] = (np.diff(times) != 0) | np.any(np.diff(columns, axis=1) != 0, axis=0)
+
+    return {
+        "times": times[keep],
+        "max": columns[0][keep],
+        "mean": columns[1][keep],
+        "over": columns[2][keep].astype(np.int64),
+    }
+
+
+def aggregate_payload(aggregate: dict[str, np.ndarray], threshold: float = LEGAL_LIMIT) -> dict:
+    """JSON-ready columnar form of aggregate_timelines output, with ISO 8601 UTC times."""
+    times = np.datetime_as_string((aggregate["times"] * 1000).astype("datetime64[ms]"), unit="ms", timezone="UTC")
+    return {
+        "threshold": threshold,
+        "times": times.tolist(),
+        "max": aggregate["max"].tolist(),
+        "mean": aggregate["mean"].tolist(),
+        "over": aggregate["over"].tolist(),
+    }
+
+
+def aggregate_timelines_payload(timelines: list[BACTimeline], threshold: float = LEGAL_LIMIT) -> dict:
+    """aggregate_payload of aggregate_timelines, in one call for the compute pool."""
+    return aggregate_payload(aggregate_timelines(timelines, threshold), threshold)
+
+
+def aggregate_states(states_by_member: list[list[dict]], threshold: float = LEGAL_LIMIT) -> dict:
+    """aggregate_timelines_payload of the members' state payloads, as plain data for the compute pool."""
+    return aggregate_timelines_payload([BACTimeline.from_payload(states) for states in states_by_member], threshold)
+
+
+def member_summaries(states_by_member: list[list[dict]], drink_counts: list[int], now: datetime) -> list[dict]:
+    """Compact figures per member of a large group, in place of their drinks and states."""
+    summaries = []
+    for states, drink_count in zip(states_by_member, drink_counts):
+        timeline = BACTimeline.from_payload(states)
+        peak = timeline.peak()
+        summaries.append({
+            "bac": timeline.bac_at(now), "peak": peak["bac"] if peak else 0.0,
+            "soberTime": timeline.sober_time(), "drinkCount": drink_count,
+        })
+    return summaries
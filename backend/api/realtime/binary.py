@@ -0,0 +1,134 @@
+import json
+import struct
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from api.realtime.timeline import BACTimeline
+
+FORMAT_VERSION = 1
+
+_DTYPES = {"f64": "<f8", "f32": "<f4", "u32": "<u4"}
+
+
+def epoch_ms(value) -> Optional[int]:
+    """Milliseconds since the epoch for a datetime or an ISO 8601 string."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return round(value.timestamp() * 1000)
+
+
+class _Columns:
+    def __init__(self):
+        self.specs: list[dict] = []
+        self.arrays: list[np.ndarray] = []
+
+    def add(self, kind: str, values) -> dict:
+        self.specs.append({"type": kind, "length": len(values)})
+        self.arrays.append(np.asarray(values, dtype=_DTYPES[kind]))
+        return {"$col": len(self.arrays) - 1}
+
+    def states(self, states: list[dict]) -> dict:
+        timeline = BACTimeline.from_payload(states)
+        return {"times": self.add("f64", timeline.times * 1000), "bac": self.add("f32", timeline.bacs)}
+
+    def aggregate(self, aggregate: Optional[dict]) -> Optional[dict]:
+        if aggregate is None:
+            return None
+        times = np.array([t.rstrip("Z") for t in aggregate["times"]], dtype="datetime64[ms]").astype(np.int64)
+        return {
+            "threshold": aggregate["threshold"], "times": self.add("f64", times),
+            "max": self.add("f32", aggregate["max"]), "mean": self.add("f32", aggregate["mean"]),
+            "over": self.add("u32", aggregate["over"]),
+        }
+
+
+def _drinks(drinks: list[dict]) -> list[dict]:
+    return [{**d, "time": epoch_ms(d["time"])} for d in drinks]
+
+
+def encode_message(message: dict) -> bytes:
+    """
+    Compact binary form of an 'init', 'update', 'delta' or 'group' message for the WebSocket stream.
+
+    A frame is a one-byte format version, a little-endian uint32 header length, the header as compact UTF-8
+    JSON, then the column data. BAC states and group aggregates travel as columns rather than lists of objects:
+    the header holds {"$col": i} in their place and lists each column's type ('f64' times, 'f32' BAC values,
+    'u32' counts) and length under "columns". Columns are padded to 8 bytes so clients can view them as typed
+    arrays without copying. All times are epoch milliseconds. Other message types are sent as a header only.
+    """
+    columns = _Columns()
+    header = dict(message)
+    kind = message.get("type")
+
+    if kind in ("update", "delta"):
+        header["states"] = columns.states(message["states"])
+        if kind == "update":
+            header["drinks"] = _drinks(message["drinks"])
+        else:
+            header["drinks_upserted"] = _drinks(message["drinks_upserted"])
+            header["states_since"] = epoch_ms(message["states_since"])
+    elif kind == "init":
+        header["states"] = {uid: columns.states(states) for uid, states in message["states"].items()}
+        header["drinks"] = {uid: _drinks(drinks) for uid, drinks in message["drinks"].items()}
+        header["aggregate"] = columns.aggregate(message["aggregate"])
+        if message.get("summaries"):
+            header["summaries"] = {
+                uid: {**summary, "soberTime": epoch_ms(summary["soberTime"])}
+                for uid, summary in message["summaries"].items()
+            }
+    elif kind == "group":
+        header["aggregate"] = columns.aggregate(message["aggregate"])
+
+    header["columns"] = columns.specs
+    header_bytes = json.dumps(header, separators=(",", ":"), default=epoch_ms).encode()
+    parts = [struct.pack("<BI", FORMAT_VERSION, len(header_bytes)), header_bytes]
+    offset = 5 + len(header_bytes)
+    for array in columns.arrays:
+        padding = -offset % 8
+        parts += [b"\0" * padding, array.tobytes()]
+        offset += padding + array.nbytes
+    return b"".join(parts)
+
+
+@lru_cache(maxsize=256)
+def encode_event(event_id: Optional[int], data: str) -> bytes:
+    """
+    Encode a published message once per worker, however many connections it goes out to.
+    :param event_id: ID to resume the stream from, sent as 'eventId'.
+    :param data: The message JSON as published.
+    """
+    message = json.loads(data)
+    if event_id is not None:
+        message["eventId"] = event_id
+    return encode_message(message)
+
+
+def decode_message(frame: bytes) -> dict:
+    """Inverse of encode_message, with columns decoded to NumPy arrays."""
+    version, length = struct.unpack_from("<BI", frame)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported realtime frame version {version}")
+    header = json.loads(frame[5:5 + length])
+
+    arrays, offset = [], 5 + length
+    for spec in header.pop("columns"):
+        offset += -offset % 8
+        dtype = np.dtype(_DTYPES[spec["type"]])
+        arrays.append(np.frombuffer(frame, dtype=dtype, count=spec["length"], offset=offset))
+        offset += dtype.itemsize * spec["length"]
+
+    def resolve(value):
+        if isinstance(value, dict):
+            if "$col" in value:
+                return arrays[value["$col"]]
+            return {k: resolve(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [resolve(v) for v in value]
+        return value
+
+    return resolve(header)
@@ -1,6 +1,10 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
 
 from api.config import (
+    BODY_PROFILE_CACHE_SIZE,
     MIN_WEIGHT,
     MAX_WEIGHT,
     MIN_HEIGHT,
@@ -8,6 +12,7 @@ from api.config import (
     MIN_AGE,
     MAX_AGE,
 )
+from api.realtime.timeline import BACTimeline, to_epoch
 
 ALCOHOL_DENSITY = 0.789  # g/mL
 DEFAULT_METABOLISM_RATE = 0.015  # BAC per hour
@@ -58,6 +63,73 @@ def get_widmark_factor(gender: str) -> float:
             raise AssertionError("Gender must be either Male or Female!")
 
 
+class BodyProfile:
+    """
+    Validated body constants for one user, so per-drink BAC is a single multiplication.
+
+    Validation happens once here rather than on every drink; use get_body_profile to share profiles.
+    """
+
+    __slots__ = ("weight", "height", "age", "gender", "bac_per_gram")
+
+    def __init__(self, weight: float, height: float = None, age: float = None, gender: str = "MALE"):
+        """
+        :param weight: Body weight in kg.
+        :param height: Height in cm.
+        :param age: Age in years.
+        :param gender: "MALE" or "FEMALE".
+        """
+
+        assert MIN_WEIGHT <= weight <= MAX_WEIGHT, (
+            f"Body weight must be >={MIN_WEIGHT} and <={MAX_WEIGHT} kg!"
+        )
+        gender = gender.upper()
+        assert gender in ["MALE", "FEMALE"], "Gender must be either Male or Female!"
+
+        self.weight = weight
+        self.height = height
+        self.age = age
+        self.gender = gender
+
+        if height and age:
+            assert MIN_AGE <= age <= MAX_AGE, (
+                f"Age must be >={MIN_AGE} and <={MAX_AGE} years!"
+            )
+            assert MIN_HEIGHT <= height <= MAX_HEIGHT, (
+                f"Height must be >={MIN_HEIGHT} and <={MAX_HEIGHT} cm!"
+            )
+            # BAC = alcohol_grams / (TBW * 10)
+            self.bac_per_gram = 1 / (get_total_body_water(gender, age, height, weight) * 10)
+        else:
+            self.bac_per_gram = 100 / (weight * 1000 * get_widmark_factor(gender))
+
+    def drink_bac(self, drink_ml: float, drink_strength: float) -> float:
+        """
+        Instantaneous BAC of a drink at peak absorption, as get_bac. Drinks are validated by the drink schemas.
+        :param drink_ml: Drink volume in mL.
+        :param drink_strength: Alcohol strength as a decimal.
+        :return: Instantaneous BAC as a percentage (g/dL).
+        """
+
+        return max(0.0, drink_ml * drink_strength * ALCOHOL_DENSITY * self.bac_per_gram)
+
+
+@lru_cache(maxsize=BODY_PROFILE_CACHE_SIZE)
+def _cached_body_profile(weight: float, height: float | None, age: float | None, gender: str) -> BodyProfile:
+    return BodyProfile(weight, height, age, gender)
+
+
+def get_body_profile(user_data: dict) -> BodyProfile:
+    """
+    Return the shared, validated body profile for a user, evicting the least recently used profiles beyond
+    BODY_PROFILE_CACHE_SIZE.
+    :param user_data: Dictionary with user data, including 'weight', 'height', 'age', and 'gender'.
+    """
+
+    return _cached_body_profile(user_data["weight"], user_data["height"], user_data["age"],
+                                user_data["gender"].upper())
+
+
 def get_bac(drink_ml: float, drink_strength: float, body_weight: float, gender: str,
             age: float = None, height: float = None) -> float:
     """
@@ -86,24 +158,8 @@ def get_bac(drink_ml: float, drink_strength: float, body_weight: float, gender:
     )
     assert gender.upper() in ["MALE", "FEMALE"], "Gender must be either Male or Female!"
 
-    alcohol_grams = drink_ml * drink_strength * ALCOHOL_DENSITY
-
-    if height and age:
-        assert MIN_AGE <= age <= MAX_AGE, (
-            f"Age must be >={MIN_AGE} and <={MAX_AGE} years!"
-        )
-        assert MIN_HEIGHT <= height <= MAX_HEIGHT, (
-            f"Height must be >={MIN_HEIGHT} and <={MAX_HEIGHT} cm!"
-        )
-
-        tbw = get_total_body_water(gender, age, height, body_weight)
-        bac = alcohol_grams / (tbw * 10)
-        return max(0.0, bac)
-    else:
-        body_weight_g = body_weight * 1000
-        widmark_factor = get_widmark_factor(gender)
-        bac = (alcohol_grams / (body_weight_g * widmark_factor)) * 100
-        return max(0.0, bac)
+    profile = _cached_body_profile(body_weight, height, age, gender.upper())
+    return profile.drink_bac(drink_ml, drink_strength)
 
 
 def drink_to_bac(drink: dict, user_data: dict) -> dict:
@@ -164,50 +220,253 @@ def drinks_to_bac(drinks: list[dict], user_data: dict, metabolism_rates: float |
     assert "age" in user_data, "User data must have an 'age' key!"
     assert "gender" in user_data, "User data must have a 'gender' key!"
 
-    def accumulate_bac(metabolism_rate):
-        states = []
+    # Validated once, leaving a single multiplication per drink in the loop below
+    profile = get_body_profile(user_data)
+
+    def accumulate_bac(rates: dict[str, float]) -> dict[str, list[dict]]:
+        # A drink's absorbed BAC doesn't depend on the metabolism rate, so it is worked out once and every rate
+        # lane is advanced in the same pass over the drinks
+        lanes = {label: [] for label in rates}
         for drink in drinks:
             if drink["volume"] <= 0 or drink["strength"] <= 0:
                 continue
 
+            drink_bac = profile.drink_bac(drink["volume"], drink["strength"])
+            for label, metabolism_rate in rates.items():
+                states = lanes[label]
+                if states:
+                    prev_state = states[-1]
+                    time_diff = (drink["time"] - prev_state["time"]).total_seconds() / 3600
+                    bac_decrease = time_diff * metabolism_rate
+                    bac = max(0.0, prev_state["bac"] - bac_decrease)
+                    if bac == 0.0:
+                        states = lanes[label] = []
+                    states.append({'time': drink["time"], 'bac': bac})
+                else:
+                    states.append({'time': drink["time"], 'bac': 0.0})
+
+                new_bac = states[-1]["bac"] + drink_bac
+                states.append({'time': drink["time"], 'bac': new_bac})
+
+        for label, states in lanes.items():
             if states:
-                prev_state = states[-1]
-                time_diff = (drink["time"] - prev_state["time"]).total_seconds() / 3600
-                bac_decrease = time_diff * metabolism_rate
-                bac = max(0.0, prev_state["bac"] - bac_decrease)
-                if bac == 0.0:
-                    states = []
-                states.append({'time': drink["time"], 'bac': bac})
-            else:
-                states.append({'time': drink["time"], 'bac': 0.0})
-
-            new_bac = states[-1]["bac"] + drink_to_bac(drink, user_data)["bac"]
-            states.append({'time': drink["time"], 'bac': new_bac})
-
-        if states:
-            sobriety_hours = states[-1]["bac"] / metabolism_rate
-            sobriety_time = states[-1]["time"] + timedelta(hours=sobriety_hours)
-            states.append({'time': sobriety_time, 'bac': 0.0})
-
-        return states
+                sobriety_hours = states[-1]["bac"] / rates[label]
+                sobriety_time = states[-1]["time"] + timedelta(hours=sobriety_hours)
+                states.append({'time': sobriety_time, 'bac': 0.0})
+
+        return lanes
 
     if isinstance(metabolism_rates, dict):
         for _, metabolism_rate in metabolism_rates.items():
             if not metabolism_rate > 0:
                 raise AssertionError("Metabolism rates must be above 0!")
-        return {
-            label: accumulate_bac(metabolism_rate)
-            for label, metabolism_rate in metabolism_rates.items()
-        }
+        return accumulate_bac(metabolism_rates)
 
     elif isinstance(metabolism_rates, (int, float)):
         assert metabolism_rates > 0, "Metabolism rates must be above 0!"
-        return accumulate_bac(metabolism_rates)
+        return accumulate_bac({"": metabolism_rates})[""]
 
     else:
         raise ValueError("Metabolism rates must be a float or a dictionary of floats!")
 
 
+def pack_drinks(drinks_by_member: list[list[dict]], users_data: list[dict]) -> dict[str, np.ndarray]:
+    """
+    Pack the drinks and body parameters of several users into flat NumPy arrays for batch_drinks_to_bac.
+
+    Drinks of member k occupy the slice offsets[k]:offsets[k + 1] of the drink arrays.
+
+    :param drinks_by_member: One chronologically ordered list of drinks per member, as taken by drinks_to_bac.
+    :param users_data: One user data dictionary per member, including 'weight', 'height', 'age', and 'gender'.
+    :return: Dictionary of keyword arguments for batch_drinks_to_bac.
+    """
+
+    assert len(drinks_by_member) == len(users_data), "Every member must have both drinks and user data!"
+
+    counts = [len(drinks) for drinks in drinks_by_member]
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    drinks = [drink for member_drinks in drinks_by_member for drink in member_drinks]
+    return {
+        "times": np.fromiter((to_epoch(d["time"]) for d in drinks), dtype=np.float64, count=len(drinks)),
+        "volumes": np.fromiter((d["volume"] for d in drinks), dtype=np.float64, count=len(drinks)),
+        "strengths": np.fromiter((d["strength"] for d in drinks), dtype=np.float64, count=len(drinks)),
+        "offsets": offsets,
+        "weights": np.array([u["weight"] for u in users_data], dtype=np.float64),
+        "heights": np.array([u["height"] or np.nan for u in users_data], dtype=np.float64),
+        "ages": np.array([u["age"] or np.nan for u in users_data], dtype=np.float64),
+        "genders": np.array([u["gender"].upper() for u in users_data]),
+    }
+
+
+def get_bac_factors(weights: np.ndarray, heights: np.ndarray, ages: np.ndarray, genders: np.ndarray) -> np.ndarray:
+    """
+    Vectorised body constants, converting grams of alcohol into instantaneous BAC exactly as get_bac does.
+    :param weights: Body weights in kg.
+    :param heights: Heights in cm, NaN where unknown.
+    :param ages: Ages in years, NaN where unknown.
+    :param genders: Upper-case "MALE" or "FEMALE" strings.
+    :return: BAC per gram of alcohol for each user.
+    """
+
+    assert np.all((weights >= MIN_WEIGHT) & (weights <= MAX_WEIGHT)), (
+        f"Body weight must be >={MIN_WEIGHT} and <={MAX_WEIGHT} kg!"
+    )
+    is_male = genders == "MALE"
+    assert np.all(is_male | (genders == "FEMALE")), "Gender must be either Male or Female!"
+
+    # Same rule as get_bac: Watson's TBW only when both height and age are known
+    use_tbw = (heights > 0) & (ages > 0)
+    assert np.all(~use_tbw | ((ages >= MIN_AGE) & (ages <= MAX_AGE))), (
+        f"Age must be >={MIN_AGE} and <={MAX_AGE} years!"
+    )
+    assert np.all(~use_tbw | ((heights >= MIN_HEIGHT) & (heights <= MAX_HEIGHT))), (
+        f"Height must be >={MIN_HEIGHT} and <={MAX_HEIGHT} cm!"
+    )
+
+    tbw = np.where(
+        is_male,
+        2.447 - 0.09516 * ages + 0.1074 * heights + 0.3362 * weights,
+        -2.097 + 0.1069 * heights + 0.2466 * weights,
+    )
+    widmark = np.where(is_male, 0.68, 0.55)
+    with np.errstate(invalid="ignore"):
+        return np.where(use_tbw, 1 / (tbw * 10), 100 / (weights * 1000 * widmark))
+
+
+def batch_bac_timelines(times: np.ndarray, volumes: np.ndarray, strengths: np.ndarray, offsets: np.ndarray,
+                        weights: np.ndarray, heights: np.ndarray, ages: np.ndarray, genders: np.ndarray,
+                        metabolism_rate: float | dict[str, float] = DEFAULT_METABOLISM_RATE
+                        ) -> list[BACTimeline] | list[dict[str, BACTimeline]]:
+    """
+    Vectorised drinks_to_bac for many users at once, e.g. every member of a group, returning compact timelines.
+
+       ASSUMES EACH MEMBER'S DRINKS ARE IN CHRONOLOGICAL ASCENDING ORDER!
+
+    The per-drink recurrence bac_i = max(0, bac_i-1 + drink_i-1 - rate * dt) is solved in closed form: with S the
+    running sum of (drink - rate * dt) within a member, the BAC before drink i is S_i minus the running minimum of S.
+    A drinking session restarts wherever that running minimum is reached, which is where drinks_to_bac resets.
+    Several metabolism rates are solved together as columns, sharing the per-drink BAC.
+    Use pack_drinks to build the arguments from the usual drink and user data dictionaries.
+
+    :param times: Drink times in epoch seconds.
+    :param volumes: Drink volumes in mL.
+    :param strengths: Drink strengths as decimals.
+    :param offsets: Member k owns drinks offsets[k]:offsets[k + 1], so len(offsets) is the member count plus one.
+    :param weights: Body weights in kg, one per member.
+    :param heights: Heights in cm, NaN where unknown.
+    :param ages: Ages in years, NaN where unknown.
+    :param genders: Upper-case "MALE" or "FEMALE" strings.
+    :param metabolism_rate: Metabolism rate in g/(dL * hr), or a dictionary of labelled rates.
+    :return: One timeline (or dictionary of timelines per rate) per member, matching drinks_to_bac.
+    """
+
+    labels = list(metabolism_rate) if isinstance(metabolism_rate, dict) else [None]
+    rates = np.array(list(metabolism_rate.values()) if isinstance(metabolism_rate, dict) else [metabolism_rate],
+                     dtype=np.float64)
+    assert np.all(rates > 0), "Metabolism rates must be above 0!"
+    assert np.all(volumes >= 0.0), "Drink volume must be >= 0!"
+    assert np.all((strengths >= 0.0) & (strengths <= 1.0)), "Drink strength must be between 0 and 1!"
+
+    n_members = len(offsets) - 1
+    factors = get_bac_factors(weights, heights, ages, genders)
+
+    # Drinks without alcohol are skipped entirely, as in drinks_to_bac
+    member = np.repeat(np.arange(n_members), np.diff(offsets))
+    keep = (volumes > 0) & (strengths > 0)
+    times, member = times[keep], member[keep]
+    doses = np.maximum(0.0, volumes[keep] * strengths[keep] * ALCOHOL_DENSITY * factors[member])
+
+    counts = np.bincount(member, minlength=n_members)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    is_start = np.zeros(len(times), dtype=bool)
+    is_start[starts[counts > 0]] = True
+
+    # One column per metabolism rate
+    steps = np.zeros((len(times), len(rates)))
+    steps[1:] = doses[:-1, None] - (np.diff(times) / 3600)[:, None] * rates[None, :]
+    steps[is_start] = 0.0
+    running = np.cumsum(steps, axis=0)
+    running -= np.repeat(running[starts[counts > 0]], counts[counts > 0], axis=0)
+
+    # Segmented running minimum: lifting each member above all later members keeps the minima from leaking across
+    span = float(np.ptp(running)) + 1.0 if len(running) else 1.0
+    lift = (member * 2.0 ** np.ceil(np.log2(span)))[:, None]
+    lifted = running - lift
+    lowest = np.minimum.accumulate(lifted, axis=0)
+    resets = lifted <= lowest
+    pre_bac = np.where(resets, 0.0, np.maximum(0.0, running - (lowest + lift)))
+    post_bac = pre_bac + doses[:, None]
+
+    # Each member's timeline starts at their last reset
+    last_reset = np.maximum.accumulate(np.where(resets, np.arange(len(times))[:, None], -1), axis=0)
+
+    # Lay every member's states out back to back: a state before and after each drink of their current session,
+    # then a final sobriety state, and split the result into per-member views
+    has_drinks = counts > 0
+    drink_index = np.arange(len(times))
+    lanes = []
+    for lane in range(len(rates)):
+        session_start = np.repeat(last_reset[ends[has_drinks] - 1, lane], counts[has_drinks])
+        in_session = np.flatnonzero(drink_index >= session_start)
+        state_counts = 2 * np.bincount(member[in_session], minlength=n_members) + has_drinks
+        state_offsets = np.cumsum(state_counts) - state_counts
+
+        out_times = np.empty(int(state_counts.sum()))
+        out_bacs = np.empty(len(out_times))
+        positions = state_offsets[member[in_session]] + 2 * (in_session - session_start[in_session])
+        out_times[positions] = out_times[positions + 1] = times[in_session]
+        out_bacs[positions] = pre_bac[in_session, lane]
+        out_bacs[positions + 1] = post_bac[in_session, lane]
+
+        last = ends[has_drinks] - 1
+        sober = state_offsets[has_drinks] + state_counts[has_drinks] - 1
+        out_times[sober] = times[last] + post_bac[last, lane] / rates[lane] * 3600
+        out_bacs[sober] = 0.0
+
+        lanes.append(list(zip(np.split(out_times, state_offsets[1:]), np.split(out_bacs, state_offsets[1:]))))
+
+    results = []
+    for k in range(n_members):
+        timelines = {label: BACTimeline(*lanes[lane][k]) for lane, label in enumerate(labels)}
+        results.append(timelines if isinstance(metabolism_rate, dict) else timelines[None])
+
+    return results
+
+
+def batch_state_payloads(drinks_by_member: list[list[dict]], users_data: list[dict]) -> list[list[dict]]:
+    """
+    Each member's BAC states as JSON-ready payloads, from one batch_bac_timelines pass.
+    Takes and returns plain data so it can run in the compute pool's child processes.
+    """
+    return [timeline.to_payload() for timeline in batch_bac_timelines(**pack_drinks(drinks_by_member, users_data))]
+
+
+def batch_drinks_to_bac(times: np.ndarray, volumes: np.ndarray, strengths: np.ndarray, offsets: np.ndarray,
+                        weights: np.ndarray, heights: np.ndarray, ages: np.ndarray, genders: np.ndarray,
+                        metabolism_rate: float | dict[str, float] = DEFAULT_METABOLISM_RATE
+                        ) -> list[list[dict]] | list[dict[str, list[dict]]]:
+    """
+    Vectorised drinks_to_bac for many users at once, returning lists of states. See batch_bac_timelines.
+    :return: One result per member, matching drinks_to_bac for that member's drinks.
+    """
+
+    timelines = batch_bac_timelines(times, volumes, strengths, offsets, weights, heights, ages, genders,
+                                    metabolism_rate)
+
+    results = []
+    for count, timeline in zip(np.diff(offsets).tolist(), timelines):
+        if not count:
+            results.append([])
+        elif isinstance(timeline, dict):
+            results.append({label: lane.to_states() for label, lane in timeline.items()})
+        else:
+            results.append(timeline.to_states())
+    return results
+
+
 if __name__ == "__main__":
     import matplotlib.pyplot as plt
 
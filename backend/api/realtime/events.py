@@ -0,0 +1,138 @@
+from typing import List, Optional
+
+from api.config import REALTIME_REPLAY_LENGTH, REALTIME_REPLAY_TTL
+from api.core.db import redis_client
+
+EVENT_COUNTER_KEY = "realtime:event_id"
+
+# Seconds a channel's meta hash is kept, outliving its log so a client resuming after the log expired resyncs
+REPLAY_META_TTL = 2 * REALTIME_REPLAY_TTL
+
+# Numbers the event from one counter shared by every channel, logs it to the channel's capped stream and
+# publishes it as "<id> <message>", all atomically so events reach every log and subscriber in ID order.
+# The meta hash remembers the channel's latest ID and the newest ID trimmed from its log.
+PUBLISH_SCRIPT = """
+local id = redis.call('INCR', KEYS[1])
+if redis.call('XLEN', KEYS[2]) >= tonumber(ARGV[3]) then
+    local oldest = redis.call('XRANGE', KEYS[2], '-', '+', 'COUNT', 1)[1][1]
+    redis.call('HSET', KEYS[3], 'trimmed', string.match(oldest, '^(%d+)'))
+end
+redis.call('XADD', KEYS[2], 'MAXLEN', ARGV[3], id .. '-0', 'data', ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+redis.call('HSET', KEYS[3], 'last', id)
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+redis.call('PUBLISH', ARGV[1], id .. ' ' .. ARGV[2])
+return id
+"""
+
+# Uses up an event ID for a message that wasn't published, marking it as trimmed so clients resuming from
+# before it resync instead of replaying around the gap.
+SKIP_SCRIPT = """
+local id = redis.call('INCR', KEYS[1])
+redis.call('HSET', KEYS[2], 'trimmed', id, 'last', id)
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return id
+"""
+
+
+def replay_key(channel: str) -> str:
+    """Redis stream holding the most recent events of a channel."""
+    return f"replay:{channel}"
+
+
+def replay_meta_key(channel: str) -> str:
+    return f"replay:meta:{channel}"
+
+
+async def publish_event(channel: str, message_json: str) -> int:
+    """
+    Publish a message with the next event ID, keeping it in the channel's replay log for reconnecting clients.
+    :return: The event ID.
+    """
+
+    script = redis_client.register_script(PUBLISH_SCRIPT)
+    return int(await script(
+        keys=[EVENT_COUNTER_KEY, replay_key(channel), replay_meta_key(channel)],
+        args=[channel, message_json, REALTIME_REPLAY_LENGTH, REALTIME_REPLAY_TTL, REPLAY_META_TTL],
+    ))
+
+
+async def skip_event(channel: str) -> int:
+    """Account for a message left unpublished because nobody was watching the channel."""
+    script = redis_client.register_script(SKIP_SCRIPT)
+    return int(await script(keys=[EVENT_COUNTER_KEY, replay_meta_key(channel)], args=[REPLAY_META_TTL]))
+
+
+def parse_event(data: str) -> tuple[Optional[int], str]:
+    """Split a published message into its event ID and JSON. Control messages carry no ID."""
+    if data[:1].isdigit():
+        event_id, message_json = data.split(" ", 1)
+        return int(event_id), message_json
+    return None, data
+
+
+async def latest_event_id() -> int:
+    """ID of the most recently published event, for clients to resume from."""
+    return int(await redis_client.get(EVENT_COUNTER_KEY) or 0)
+
+
+async def _cover_channels(channels: List[str], has_meta: List[bool], latest: int):
+    """Start the meta of channels that have none at event `latest`, and refresh every channel's meta TTL."""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for channel, exists in zip(channels, has_meta):
+            if not exists:
+                # Never published to, or its history has expired. The log covers the channel from here on.
+                pipe.hsetnx(replay_meta_key(channel), "trimmed", latest)
+                pipe.hsetnx(replay_meta_key(channel), "last", latest)
+            # Kept while clients keep streaming the channel, even if nothing is published to it
+            pipe.expire(replay_meta_key(channel), REPLAY_META_TTL)
+        await pipe.execute()
+
+
+async def resume_point(channels: List[str]) -> int:
+    """
+    ID of the most recently published event, for a client about to stream the channels to resume from.
+    Channels without a meta hash get one from here, so whatever they publish before the stream opens is replayed
+    rather than sending the client to resync.
+    """
+    latest = await latest_event_id()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for channel in channels:
+            pipe.exists(replay_meta_key(channel))
+        exists = await pipe.execute()
+    await _cover_channels(channels, [bool(e) for e in exists], latest)
+    return latest
+
+
+async def replay_events(channels: List[str], last_event_id: int) -> Optional[list[tuple[int, str]]]:
+    """
+    Events published to any of the channels after `last_event_id`, in ID order.
+    A channel with no meta hash, never published to or idle past REPLAY_META_TTL, counts as having lost its
+    history, and its meta is started over so later resumes are covered.
+    :return: None if some of them are no longer in the replay logs, in which case the client needs a full resync.
+    """
+
+    latest = await latest_event_id()
+    if last_event_id > latest:
+        # IDs from before Redis lost its data
+        return None
+
+    metas = [await redis_client.hgetall(replay_meta_key(channel)) for channel in channels]
+    await _cover_channels(channels, [bool(meta) for meta in metas], latest)
+    if last_event_id < latest and not all(metas):
+        # Something was published since, and it may have been to a channel whose history is gone
+        return None
+
+    events = []
+    for channel, meta in zip(channels, metas):
+        if int(meta.get("last", 0)) <= last_event_id:
+            continue
+        if int(meta.get("trimmed", 0)) > last_event_id:
+            return None
+
+        entries = await redis_client.xrange(replay_key(channel), min=f"{last_event_id + 1}-0", max="+")
+        if not entries:
+            # The whole log expired
+            return None
+        events += [(int(entry_id.split("-")[0]), fields["data"]) for entry_id, fields in entries]
+    return sorted(events)
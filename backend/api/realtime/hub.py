@@ -0,0 +1,244 @@
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Optional
+
+from api.config import REALTIME_PRESENCE_TTL, SSE_QUEUE_SIZE, SSE_SLOW_CONSUMER_TIMEOUT
+from api.core.db import redis_client
+from api.realtime.events import parse_event
+from api.realtime.presence import mark_present
+
+
+class SlowConsumer(Exception):
+    """
+    Raised to a connection the hub disconnected for not keeping up with its messages, or because messages were
+    lost while the hub's Redis connection was down.
+    """
+
+
+def coalesce_key(message: dict) -> Optional[tuple]:
+    """
+    What a message carries the latest state of, so a newer message with the same key supersedes it:
+    ('member', id) for member updates and deltas, ('group', id) for group aggregates, None for anything else.
+    Worked out once per message and shared by every connection holding it.
+    """
+    if "coalesce_key" not in message:
+        key = None
+        _, data = parse_event(message["data"])
+        if data.startswith("{"):
+            payload = json.loads(data)
+            if payload.get("type") in ("update", "delta") and "user_id_updated" in payload:
+                key = ("member", payload["user_id_updated"])
+            elif payload.get("type") == "group":
+                key = ("group", payload.get("group_id"))
+        message["coalesce_key"] = key
+    return message["coalesce_key"]
+
+
+class Subscription:
+    """
+    One SSE connection's view of the hub: the channels it listens to and a bounded buffer of their messages.
+
+    A full buffer makes room by dropping buffered messages superseded by the new one. A connection whose buffer
+    can't make room, or stays full for SSE_SLOW_CONSUMER_TIMEOUT seconds, is disconnected; its client
+    reconnects and catches up from the replay log or a fresh snapshot.
+    """
+
+    def __init__(self, hub: "PubSubHub", max_size: int = SSE_QUEUE_SIZE):
+        self.hub = hub
+        self.channels: set[str] = set()
+        self.max_size = max_size
+        self.dropped = False
+        self._messages: deque[dict] = deque()
+        self._ready = asyncio.Event()
+        self._full_since: Optional[float] = None
+
+    async def subscribe(self, *channels: str):
+        for channel in channels:
+            if channel not in self.channels:
+                self.channels.add(channel)
+                await self.hub._add(channel, self)
+
+    async def unsubscribe(self, *channels: str):
+        for channel in channels:
+            if channel in self.channels:
+                self.channels.discard(channel)
+                await self.hub._remove(channel, self)
+
+    async def close(self):
+        await self.unsubscribe(*list(self.channels))
+
+    async def get_message(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """
+        Next message as {'channel': str, 'data': str}, or None if none arrives within `timeout` seconds.
+        :raises SlowConsumer: If the hub disconnected this connection.
+        """
+        if not self._messages and not self.dropped:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if self.dropped:
+            raise SlowConsumer()
+        self._full_since = None
+        return self._messages.popleft()
+
+    def _deliver(self, message: dict) -> int:
+        """
+        Buffer a message for this connection.
+        :return: How many buffered messages it superseded.
+        """
+        superseded = 0
+        if len(self._messages) >= self.max_size:
+            now = time.monotonic()
+            if self._full_since is None:
+                self._full_since = now
+            key = coalesce_key(message)
+            if key is not None:
+                kept = deque(m for m in self._messages if coalesce_key(m) != key)
+                superseded = len(self._messages) - len(kept)
+                self._messages = kept
+            # Superseded deltas leave a version gap, which the client closes by fetching that member's snapshot
+            if not superseded or now - self._full_since > SSE_SLOW_CONSUMER_TIMEOUT:
+                self._drop()
+                return superseded
+
+        self._messages.append(message)
+        self._ready.set()
+        return superseded
+
+    def _drop(self):
+        self.dropped = True
+        self._messages.clear()
+        self._ready.set()
+
+
+class PubSubHub:
+    """
+    A single Redis pub/sub connection per worker process, shared by every SSE connection.
+
+    Channels are subscribed in Redis while at least one connection listens to them, and each message is
+    copied into the buffer of every connection listening to its channel. The hub also keeps the channels'
+    presence in Redis fresh, so updates to channels no worker is streaming are not published at all.
+    """
+
+    def __init__(self):
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._listeners: dict[str, set[Subscription]] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._dispatched = 0
+        self._coalesced = 0
+        self._disconnected = 0
+
+    def subscription(self) -> Subscription:
+        return Subscription(self)
+
+    async def _add(self, channel: str, subscription: Subscription):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            listeners = self._listeners.setdefault(channel, set())
+            listeners.add(subscription)
+            if len(listeners) == 1:
+                if self._pubsub is None:
+                    self._pubsub = redis_client.pubsub()
+                await self._pubsub.subscribe(channel)
+                await mark_present([channel])
+                if self._reader is None:
+                    self._reader = asyncio.create_task(self._read())
+                    self._heartbeat = asyncio.create_task(self._beat())
+
+    async def _remove(self, channel: str, subscription: Subscription):
+        async with self._lock:
+            listeners = self._listeners.get(channel)
+            if listeners is None:
+                return
+            listeners.discard(subscription)
+            if not listeners:
+                del self._listeners[channel]
+                await self._pubsub.unsubscribe(channel)
+
+    async def _read(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Pub/sub hub lost its Redis connection: {e!r}. Reconnecting.")
+                self._drop_all()
+                await asyncio.sleep(1)
+                try:
+                    await self._reconnect()
+                except Exception as e:
+                    print(f"Pub/sub hub failed to reconnect: {e!r}")
+                continue
+
+            if message is None:
+                continue
+            for subscription in self._listeners.get(message["channel"], ()):
+                if subscription.dropped:
+                    continue
+                self._coalesced += subscription._deliver(message)
+                self._dispatched += 1
+                if subscription.dropped:
+                    self._disconnected += 1
+                    print(f"Disconnecting slow SSE consumer on {message['channel']}")
+
+    def _drop_all(self):
+        """
+        Disconnect every connection, as whatever was published while the hub was disconnected never reached them.
+        Their clients reconnect and catch up from the replay log or a fresh snapshot.
+        """
+        for subscription in set().union(*self._listeners.values()):
+            if not subscription.dropped:
+                subscription._drop()
+                self._disconnected += 1
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(REALTIME_PRESENCE_TTL / 3)
+            try:
+                await mark_present(list(self._listeners))
+            except Exception as e:
+                print(f"Pub/sub hub failed to refresh presence: {e!r}")
+
+    async def _reconnect(self):
+        async with self._lock:
+            try:
+                await self._pubsub.aclose()
+            except Exception:
+                pass
+            self._pubsub = redis_client.pubsub()
+            if self._listeners:
+                await self._pubsub.subscribe(*self._listeners)
+
+    async def close(self):
+        """Stop reading and drop the Redis connection, e.g. when the worker shuts down."""
+        for task in (self._reader, self._heartbeat):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        self._pubsub = None
+        self._reader = None
+        self._heartbeat = None
+        self._listeners = {}
+        self._lock = None
+
+    def metrics(self) -> dict:
+        return {
+            "channels": len(self._listeners),
+            "connections": len(set().union(*self._listeners.values())),
+            "dispatched": self._dispatched,
+            "coalesced": self._coalesced,
+            "slowConsumersDisconnected": self._disconnected,
+        }
+
+
+hub = PubSubHub()
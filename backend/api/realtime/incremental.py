@@ -0,0 +1,183 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+import numpy as np
+
+from api.config import BAC_CHECKPOINT_CACHE_SIZE
+from api.realtime.calculations import DEFAULT_METABOLISM_RATE, get_body_profile
+from api.realtime.timeline import BACTimeline, to_epoch
+
+
+class IncrementalBAC:
+    """
+    Per-user BAC state that is updated in place as drinks change, rather than replayed from the first drink.
+
+    For every alcoholic drink it checkpoints the BAC just before that drink, so appending a drink is O(1) and
+    a back-dated insert, edit or removal only recomputes the drinks after the change. Produces the same states
+    as drinks_to_bac.
+    """
+
+    def __init__(self, user_data: dict, metabolism_rate: float = DEFAULT_METABOLISM_RATE):
+        """
+        :param user_data: Dictionary with single user data, including 'weight', 'height', 'age', and 'gender'.
+        :param metabolism_rate: Metabolism rate in g/(dL * hr).
+        """
+
+        assert metabolism_rate > 0, "Metabolism rates must be above 0!"
+
+        self.user_data = dict(user_data)
+        self.metabolism_rate = metabolism_rate
+        self.profile = get_body_profile(user_data)
+
+        self.ids = []
+        self.keys = []
+        self.times = []
+        self.doses = []
+        self.pre_bac = []
+        self.resets = []
+
+    def matches(self, user_data: dict, metabolism_rate: float = DEFAULT_METABOLISM_RATE) -> bool:
+        """Whether this checkpoint was built for the given body parameters."""
+        return self.user_data == user_data and self.metabolism_rate == metabolism_rate
+
+    def add(self, drink: dict):
+        """
+        Add a drink, recomputing only the drinks logged after it.
+        :param drink: Dictionary with keys 'id', 'time', 'volume' and 'strength'.
+        """
+
+        if drink["volume"] <= 0 or drink["strength"] <= 0:
+            return
+
+        time = to_epoch(drink["time"])
+        index = bisect_right(self.times, time)
+        self.ids.insert(index, drink.get("id"))
+        self.keys.insert(index, _drink_key(drink))
+        self.times.insert(index, time)
+        self.doses.insert(index, self.profile.drink_bac(drink["volume"], drink["strength"]))
+        self.pre_bac.insert(index, 0.0)
+        self._recompute_from(index)
+
+    def remove(self, drink_id) -> bool:
+        """
+        Remove a drink by ID, recomputing only the drinks logged after it.
+        :return: False if the drink was not part of the timeline.
+        """
+
+        try:
+            index = self.ids.index(drink_id)
+        except ValueError:
+            return False
+
+        for column in (self.ids, self.keys, self.times, self.doses, self.pre_bac):
+            del column[index]
+        self._recompute_from(index)
+        return True
+
+    def update(self, drink: dict):
+        """Replace a previously added drink with the same ID."""
+        self.remove(drink.get("id"))
+        self.add(drink)
+
+    def sync(self, drinks: list[dict]) -> int:
+        """
+        Bring the checkpoint in line with a freshly loaded, chronologically ordered list of drinks.
+
+        Drinks up to the first difference are kept as they are, so when the only change is new drinks at the
+        end nothing before them is recomputed.
+
+        :param drinks: List of drinks, each with keys 'id', 'time', 'volume' and 'strength'.
+        :return: Index of the first alcoholic drink that changed.
+        """
+
+        drinks = [d for d in drinks if d["volume"] > 0 and d["strength"] > 0]
+        keys = [_drink_key(d) for d in drinks]
+
+        index = min(len(keys), len(self.keys))
+        if keys[:index] != self.keys[:index]:
+            index = next(i for i, (old, new) in enumerate(zip(self.keys, keys)) if old != new)
+
+        for column in (self.ids, self.keys, self.times, self.doses, self.pre_bac):
+            del column[index:]
+        for drink, key in zip(drinks[index:], keys[index:]):
+            self.ids.append(drink.get("id"))
+            self.keys.append(key)
+            self.times.append(to_epoch(drink["time"]))
+            self.doses.append(self.profile.drink_bac(drink["volume"], drink["strength"]))
+            self.pre_bac.append(0.0)
+        self._recompute_from(index)
+        return index
+
+    def _recompute_from(self, index: int):
+        """Recompute the BAC checkpoints of every drink from `index` onwards."""
+        del self.resets[bisect_left(self.resets, index):]
+
+        rate = self.metabolism_rate / 3600
+        times, doses, pre_bac = self.times, self.doses, self.pre_bac
+        for i in range(index, len(times)):
+            if i == 0:
+                bac = 0.0
+            else:
+                bac = max(0.0, pre_bac[i - 1] + doses[i - 1] - (times[i] - times[i - 1]) * rate)
+            pre_bac[i] = bac
+            if bac == 0.0:
+                self.resets.append(i)
+
+    @property
+    def last_state(self) -> tuple[float, float] | None:
+        """Epoch time and BAC just after the latest drink, or None if there are no drinks."""
+        if not self.times:
+            return None
+        return self.times[-1], self.pre_bac[-1] + self.doses[-1]
+
+    @property
+    def sober_time(self) -> datetime | None:
+        """Time at which the BAC returns to zero, or None if there are no drinks."""
+        if self.last_state is None:
+            return None
+        time, bac = self.last_state
+        return datetime.fromtimestamp(time, timezone.utc) + timedelta(hours=bac / self.metabolism_rate)
+
+    def timeline(self) -> BACTimeline:
+        """The current drinking session as a compact timeline."""
+        if not self.times:
+            return BACTimeline(np.empty(0), np.empty(0))
+
+        start = self.resets[-1]
+        pre_bac = np.array(self.pre_bac[start:])
+        post_bac = pre_bac + self.doses[start:]
+        time, bac = self.last_state
+        return BACTimeline(
+            np.append(np.repeat(self.times[start:], 2), time + bac / self.metabolism_rate * 3600),
+            np.append(np.column_stack((pre_bac, post_bac)).ravel(), 0.0),
+        )
+
+    def states(self) -> list[dict]:
+        """The current drinking session as a list of states, as returned by drinks_to_bac."""
+        return self.timeline().to_states()
+
+
+def _drink_key(drink: dict) -> tuple:
+    return drink.get("id"), drink["time"], drink["volume"], drink["strength"]
+
+
+_checkpoints: OrderedDict[UUID, IncrementalBAC] = OrderedDict()
+
+
+def get_checkpoint(user_id: UUID, user_data: dict, metabolism_rate: float = DEFAULT_METABOLISM_RATE) -> IncrementalBAC:
+    """
+    Return the cached checkpoint for a user, starting a fresh one if their body parameters changed.
+    Least recently used checkpoints are evicted beyond BAC_CHECKPOINT_CACHE_SIZE users.
+    """
+
+    checkpoint = _checkpoints.get(user_id)
+    if checkpoint is None or not checkpoint.matches(user_data, metabolism_rate):
+        checkpoint = IncrementalBAC(user_data, metabolism_rate)
+        _checkpoints[user_id] = checkpoint
+
+    _checkpoints.move_to_end(user_id)
+    while len(_checkpoints) > BAC_CHECKPOINT_CACHE_SIZE:
+        _checkpoints.popitem(last=False)
+    return checkpoint
@@ -0,0 +1,21 @@
+from typing import Iterable
+
+from api.config import REALTIME_PRESENCE_TTL
+from api.core.db import redis_client
+
+
+def presence_key(channel: str) -> str:
+    return f"presence:{channel}"
+
+
+async def mark_present(channels: Iterable[str]):
+    """Record that this worker has open streams on the channels, for the next REALTIME_PRESENCE_TTL seconds."""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for channel in channels:
+            pipe.set(presence_key(channel), 1, ex=REALTIME_PRESENCE_TTL)
+        await pipe.execute()
+
+
+async def is_watched(channel: str) -> bool:
+    """Whether any worker has an open stream on the channel."""
+    return bool(await redis_client.exists(presence_key(channel)))
@@ -1,34 +1,45 @@
-import json
 import asyncio
+import json
 import jwt
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from functools import lru_cache, partial
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 from uuid import UUID
-from typing import Dict, Optional, List
+from typing import AsyncIterator, Dict, Optional, List
 from sse_starlette.sse import EventSourceResponse
 
-from sqlalchemy import select
+from fastapi_users.db import SQLAlchemyUserDatabase
+from sqlalchemy import func, select
 from sqlalchemy.orm import selectinload
 
 from api.auth.auth import ALGORITHM, SECRET
+from api.config import COMPUTE_CHUNK_MEMBERS, MAX_CURVE_POINTS, REALTIME_MEMBER_PAGE_SIZE
 from api.auth.users import UserManager
-from api.auth.deps import get_user_manager, current_active_user
+from api.auth.deps import current_active_user, current_superuser
 from api.drinks.models import Drink
 from api.group.models import UserGroup, Group
 from api.auth.models import User
-from api.core.db import get_async_session, redis_client
+from api.core.compute import compute_pool
+from api.core.db import get_async_session
+from api.core.work_queue import work_queue
 from api.group.deps import get_active_group
-from api.realtime.calculations import drinks_to_bac
+from api.realtime.admission import stream_admission
+from api.realtime.actions import aggregate_flights, group_channel, personal_channel, shared_aggregate
+from api.realtime.aggregate import aggregate_timelines_payload, member_summaries
+from api.realtime.binary import encode_event
+from api.realtime.events import parse_event, replay_events, resume_point
+from api.realtime.hub import SlowConsumer, Subscription, coalesce_key, hub
+from api.realtime.incremental import get_checkpoint
+from api.realtime.snapshots import load_snapshots, snapshot_builds, user_profile
+from api.realtime.timeline import BACTimeline, LEGAL_LIMIT, resample, to_epoch
+from api.utils import bac_user_data
 
 router = APIRouter()
 
 
-async def get_user_for_sse(
-    request: Request,
-    user_manager: UserManager = Depends(get_user_manager),
-) -> User:
-    """Dependency to authenticate a user for SSE via a URL query token."""
-    token = request.query_params.get("token")
+async def user_from_token(token: Optional[str], user_manager: UserManager) -> User:
+    """The active user a JWT was issued to, for streams that can't send an Authorization header."""
     if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -60,102 +71,589 @@ async def get_user_for_sse(
         )
 
 
+def admit_stream():
+    """
+    Dependency refusing new streams with a 503 and a jittered Retry-After while the worker is admitting too many.
+    Declared ahead of authentication, so refused reconnects cost neither a token check nor a database read.
+    """
+    if not stream_admission.admit():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many new connections, retry later.",
+            headers={"Retry-After": str(stream_admission.retry_after())},
+        )
+
+
+async def stream_user(token: Optional[str]) -> User:
+    """
+    user_from_token in a session of its own, closed before the stream starts, rather than a dependency's
+    session that would keep a pooled connection checked out for as long as the stream stays open.
+    """
+    async for session in get_async_session():
+        user = await user_from_token(token, UserManager(SQLAlchemyUserDatabase(session, User)))
+    return user
+
+
+async def get_user_for_sse(request: Request, _admitted: None = Depends(admit_stream)) -> User:
+    """Dependency to authenticate a user for SSE via a URL query token."""
+    return await stream_user(request.query_params.get("token"))
+
+
+def curve_options(
+    points: Optional[int] = Query(None, ge=3, le=MAX_CURVE_POINTS),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Optional[dict]:
+    """
+    Optional server-side resampling of each member's BAC curve for charts: `points` per curve, at a fixed
+    resolution across [start, end] when a window is given, otherwise shape-preserving.
+    """
+    if points is None:
+        return None
+    return {"points": points, "start": start, "end": end}
+
+
+def resample_update(message_json: str, options: dict) -> str:
+    """Swap the state list of an update message, or the states tail of a delta, for a resampled curve."""
+    message = json.loads(message_json)
+    if message.get("type") not in ("update", "delta") or not message["states"]:
+        return message_json
+    timeline = BACTimeline.from_payload(message["states"])
+    if message["type"] == "delta" and options["start"] is not None:
+        # Deltas are spliced in by time, so the samples must not reach back before the tail
+        options = {**options, "start": max(to_epoch(options["start"]), timeline.times[0])}
+    message["states"] = resample(timeline, **options).to_payload()
+    return json.dumps(message)
+
+
+@lru_cache(maxsize=256)
+def resample_event(event_id: int, data: str, points: int, start: Optional[datetime], end: Optional[datetime]) -> str:
+    """
+    resample_update once per worker for each published event and curve, however many connections ask for it.
+    :param event_id: ID of the published event.
+    :param data: The message JSON as published.
+    """
+    return resample_update(data, {"points": points, "start": start, "end": end})
+
+
+async def get_member(session, user: User, group: Optional[Group], user_id: Optional[UUID]) -> User:
+    """The user themselves, or the member of their active group with the given ID."""
+    if user_id is None or user_id == user.id:
+        return user
+
+    membership = None
+    if group is not None:
+        result = await session.execute(
+            select(UserGroup)
+            .options(selectinload(UserGroup.user))
+            .where(UserGroup.group_id == group.id, UserGroup.user_id == user_id)
+        )
+        membership = result.scalar_one_or_none()
+    if membership is None:
+        raise HTTPException(status_code=404, detail="Member not found.")
+    return membership.user
+
+
+def sse_event(event_id: Optional[int], data: str, curve: Optional[dict] = None) -> dict:
+    if curve and event_id is not None:
+        data = resample_event(event_id, data, curve["points"], curve["start"], curve["end"])
+    elif curve:
+        data = resample_update(data, curve)
+    # MODIFICATION: Send a default, unnamed event.
+    # sse-starlette encodes IDs as strings
+    return {"data": data} if event_id is None else {"id": str(event_id), "data": data}
+
+
+def is_aggregate(message: dict) -> bool:
+    """Whether a published message is a group aggregate, which only reaches streams that asked for them."""
+    key = coalesce_key(message)
+    return key is not None and key[0] == "group"
+
+
+async def relay_messages(
+    subscription: Subscription, own_channel: str, curve: Optional[dict] = None, after: int = 0,
+    aggregate: bool = False,
+):
+    """
+    Yield SSE events for one connection as its messages arrive, skipping events up to ID `after` that the
+    client already has, and group aggregates unless `aggregate` is set.
+
+    Waits on the connection's queue instead of polling, so an idle stream costs no wakeups. Client disconnects
+    arrive on the ASGI receive channel, where EventSourceResponse picks them up and cancels this generator.
+    """
+    while True:
+        message = await subscription.get_message()
+        event_id, data = parse_event(message["data"])
+        # Control messages are the ones published without an event ID. Membership changes move the stream to the
+        # new group's channel rather than reaching the client.
+        control = json.loads(data) if event_id is None and message["channel"] == own_channel else {}
+        if control.get("type") == "subscribe":
+            new_group_id = control["group_id"]
+            await subscription.unsubscribe(*(subscription.channels - {own_channel}))
+            if new_group_id:
+                await subscription.subscribe(group_channel(new_group_id))
+            print(f"SSE stream for {own_channel} MOVED to group: {new_group_id}")
+            continue
+
+        if (event_id is not None and event_id <= after) or (not aggregate and is_aggregate(message)):
+            continue
+        yield sse_event(event_id, data, curve)
+
+
+def parse_event_id(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def stream_channels(user_id: UUID, group_id: Optional[UUID]) -> List[str]:
+    """The channels a user's realtime connection subscribes to: their own, and their active group's."""
+    return [personal_channel(user_id)] + ([group_channel(group_id)] if group_id else [])
+
+
+async def stream_events(
+    user_id: UUID, group_id: Optional[UUID], curve: Optional[dict], resume_from: Optional[int],
+    aggregate: bool = False,
+):
+    """
+    Events for one realtime connection, as SSE-style dicts, until the client goes away. Group aggregates are
+    only included with `aggregate`.
+
+    A client resuming after event `resume_from` is first replayed what its channels published since. If that
+    has already dropped out of the replay logs it gets a 'resync' event instead, telling it to reload the
+    full initial state. That event is flagged with a `resync` key, which is not part of the SSE event.
+    :raises SlowConsumer: If the connection fell too far behind its messages.
+    """
+    channels = stream_channels(user_id, group_id)
+    own_channel = channels[0]
+    # Shares the worker's single Redis subscription rather than opening one per client
+    subscription = hub.subscription()
+    await subscription.subscribe(*channels)
+    print(f"Realtime stream SUBSCRIBED to channels: {', '.join(channels)}")
+    try:
+        # Replayed after subscribing, so nothing published in between is lost; the relay skips duplicates
+        after = 0
+        if resume_from is not None:
+            replayed = await replay_events(list(subscription.channels), resume_from)
+            if replayed is None:
+                yield {"data": json.dumps({"type": "resync"}), "resync": True}
+            else:
+                for event_id, data in replayed:
+                    if aggregate or not is_aggregate({"data": data}):
+                        yield sse_event(event_id, data, curve)
+                after = replayed[-1][0] if replayed else resume_from
+
+        async for event in relay_messages(subscription, own_channel, curve, after, aggregate):
+            yield event
+    finally:
+        print(f"Realtime stream CLOSING for channel: {own_channel}")
+        await subscription.close()
+
+
+async def active_group_id(user_id: UUID) -> Optional[UUID]:
+    async for session in get_async_session():
+        result = await session.execute(
+            select(UserGroup.group_id).where(UserGroup.user_id == user_id, UserGroup.active.is_(True))
+        )
+        group_id = result.scalars().first()
+    # Returned after the loop, so the session closes now rather than whenever the generator is collected
+    return group_id
+
+
 @router.get("/stream/{user_id}")
 async def sse_stream(
     user_id: UUID,
-    request: Request,
-    auth_user: User = Depends(get_user_for_sse)
+    auth_user: User = Depends(get_user_for_sse),
+    curve: Optional[dict] = Depends(curve_options),
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    aggregate: bool = False,
 ):
-    """Establishes a Server-Sent Events connection for a user."""
+    """
+    Establishes a Server-Sent Events connection for a user.
+
+    Clients resume from the `Last-Event-ID` header browsers send when they reconnect, or else from the
+    `last_event_id` returned with the initial state. With `aggregate`, the stream also carries the group's
+    'group' aggregate messages.
+    """
     if user_id != auth_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not authorized to access this stream.",
         )
 
-    channel_name = f"sse:{auth_user.id}"
+    group_id = await active_group_id(auth_user.id)
+    resume_from = parse_event_id(last_event_id_header)
+    if resume_from is None:
+        resume_from = parse_event_id(last_event_id)
 
     async def event_generator():
-        pubsub = redis_client.pubsub()
-        await pubsub.subscribe(channel_name)
-        print(f"SSE stream SUBSCRIBED to Redis channel: {channel_name}")
+        # Spreads the browser's automatic reconnects, stretched further while this worker is busy
+        yield {"retry": stream_admission.retry_delay_ms()}
         try:
-            while True:
-                if await request.is_disconnected():
-                    print(f"SSE client DISCONNECTED from channel: {channel_name}")
-                    break
-                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
-                if message:
-                    print(f"REDIS MESSAGE RECEIVED on backend for channel {channel_name}. Yielding to client.")
-                    # MODIFICATION: Send a default, unnamed event.
-                    yield {"data": message["data"]}
-                await asyncio.sleep(0.01)
-        finally:
-            print(f"SSE stream CLOSING for channel: {channel_name}")
-            await pubsub.unsubscribe(channel_name)
+            async for event in stream_events(auth_user.id, group_id, curve, resume_from, aggregate):
+                # The browser reloads the initial state itself on a resync event
+                event.pop("resync", None)
+                yield event
+        except SlowConsumer:
+            # Ending the response makes the browser reconnect with its Last-Event-ID and catch up
+            print(f"SSE stream for {auth_user.id} fell too far behind, disconnecting")
 
     return EventSourceResponse(event_generator())
 
 
+WS_BINARY = "baptender.binary.v1"
+WS_JSON = "baptender.json.v1"
+
+
+def choose_subprotocol(offered: List[str]) -> Optional[str]:
+    """The server's preferred subprotocol among those a WebSocket client offers, or None for plain JSON."""
+    return next((p for p in (WS_BINARY, WS_JSON) if p in offered), None)
+
+
+@router.websocket("/ws/{user_id}")
+async def websocket_stream(
+    websocket: WebSocket,
+    user_id: UUID,
+    token: Optional[str] = None,
+    last_event_id: Optional[int] = None,
+    curve: Optional[dict] = Depends(curve_options),
+    aggregate: bool = False,
+):
+    """
+    Realtime stream over a WebSocket, starting with the initial state so no separate fetch is needed.
+
+    Clients offering the 'baptender.binary.v1' subprotocol get binary frames from api.realtime.binary, with
+    epoch-millisecond times and columnar states; anyone else gets the same JSON messages as the SSE stream.
+    Every message carries an 'eventId' to reconnect with as `last_event_id`, which skips the initial state
+    when the missed events can be replayed.
+
+    Refused connections are accepted and then closed, since a close before the handshake reaches browsers as a
+    bare HTTP 403: 1013 with a "Retry after Ns" reason when the worker is admitting too many, 1008 when the
+    token doesn't grant this stream.
+    """
+    subprotocol = choose_subprotocol(websocket.scope.get("subprotocols", []))
+    await websocket.accept(subprotocol=subprotocol)
+
+    if not stream_admission.admit():
+        await websocket.close(
+            code=status.WS_1013_TRY_AGAIN_LATER, reason=f"Retry after {stream_admission.retry_after()}s",
+        )
+        return
+    try:
+        user = await stream_user(token)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return
+    if user_id != user.id:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Not your stream")
+        return
+
+    async def send(event_id: Optional[int], data: str):
+        if subprotocol == WS_BINARY:
+            await websocket.send_bytes(encode_event(event_id, data))
+        elif event_id is None:
+            await websocket.send_text(data)
+        else:
+            await websocket.send_text(json.dumps({**json.loads(data), "eventId": event_id}))
+
+    async def send_initial_state() -> int:
+        async for session in get_async_session():
+            group = await get_active_group(user, session)
+            event_id = await resume_point(stream_channels(user.id, group.id if group else None))
+            state = await build_initial_state(session, user, group, curve)
+        await send(event_id, json.dumps(state, default=str))
+        return event_id
+
+    async def pump():
+        resume_from = last_event_id
+        if resume_from is None:
+            resume_from = await send_initial_state()
+        try:
+            async for event in stream_events(user.id, await active_group_id(user.id), curve, resume_from, aggregate):
+                if event.get("resync"):
+                    await send_initial_state()
+                else:
+                    await send(parse_event_id(event.get("id")), event["data"])
+        except SlowConsumer:
+            print(f"WebSocket stream for {user.id} fell too far behind, disconnecting")
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+
+    async def wait_for_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(pump()), asyncio.create_task(wait_for_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # Also when the server cancels the connection, so the relay never outlives it. Waited for rather than
+        # gathered, which would cancel the relay's unsubscribe again if this handler is being cancelled.
+        for task in tasks:
+            task.cancel()
+        await asyncio.wait(tasks)
+    for task in tasks:
+        error = None if task.cancelled() else task.exception()
+        if isinstance(error, Exception) and not isinstance(error, WebSocketDisconnect):
+            print(f"WebSocket stream for {user.id} failed: {error!r}")
+
+
+async def initial_members(
+    session, user: User, group: Optional[Group], summary: bool,
+) -> List[User]:
+    """The users an initial state covers: the whole group, or only its active members in summary mode."""
+    if group is None:
+        return [user]
+
+    user_group_entries = await session.execute(
+        select(UserGroup)
+        .options(selectinload(UserGroup.user))
+        .where(UserGroup.group_id == group.id)
+    )
+    memberships = [ug for ug in user_group_entries.scalars().unique().all() if ug.user]
+    return [ug.user for ug in memberships if ug.active or not summary]
+
+
+def is_owner(member: User, user: User, group: Optional[Group]) -> bool:
+    return (group.owner_id == member.id) if group else (member.id == user.id)
+
+
+async def build_initial_state(
+    session, user: User, group: Optional[Group], curve: Optional[dict], summary: bool = False,
+) -> dict:
+    """
+    The complete state a client starts from: every member's profile, drinks, states and version.
+
+    In summary mode, which clients opt into, only the group's active members are included, and every member but
+    the user gets a compact summary in place of their drinks and states. Clients load those from /members as
+    members are opened.
+    """
+    relevant_user_objects = await initial_members(session, user, group, summary)
+
+    # Cached member snapshots, so reconnect storms don't reload every member's drinks from Postgres
+    snapshots = await load_snapshots(session, relevant_user_objects, group)
+
+    members_list, drinks_by_user, states_by_user = [], {}, {}
+    for u in relevant_user_objects:
+        snapshot = snapshots[u.id]
+        members_list.append({**snapshot["profile"], "isOwner": is_owner(u, user, group)})
+        if snapshot["drinks"]:
+            drinks_by_user[str(u.id)] = snapshot["drinks"]
+        states_by_user[str(u.id)] = snapshot["states"]
+
+    # Group-wide figures are computed on the compute pool for big groups, keeping the event loop free
+    aggregate = summaries = None
+    if group:
+        aggregate = await shared_aggregate(group, relevant_user_objects, snapshots)
+    if summary:
+        uids = list(states_by_user)
+        summaries = dict(zip(uids, await compute_pool.map_chunks(
+            partial(member_summaries, now=datetime.now(timezone.utc)),
+            [states_by_user[uid] for uid in uids], [len(drinks_by_user.get(uid, ())) for uid in uids],
+        )))
+        # Only the user's own detail is sent up front
+        own_id = str(user.id)
+        states_by_user = {uid: states for uid, states in states_by_user.items() if uid == own_id}
+        drinks_by_user = {uid: drinks for uid, drinks in drinks_by_user.items() if uid == own_id}
+    if curve:
+        states_by_user = {
+            uid: resample(BACTimeline.from_payload(states), **curve).to_payload()
+            for uid, states in states_by_user.items()
+        }
+
+    self_profile = next((m for m in members_list if m["id"] == str(user.id)), None)
+    versions = {str(u.id): snapshots[u.id]["version"] for u in relevant_user_objects if str(u.id) in states_by_user}
+
+    return {
+        "type": "init", "mode": "summary" if summary else "full", "self": self_profile,
+        "group": {"id": str(group.id), "name": group.name, "public": group.public} if group else None,
+        "members": members_list, "drinks": drinks_by_user, "states": states_by_user,
+        "summaries": summaries, "aggregate": aggregate, "versions": versions,
+    }
+
+
 @router.get("/initial-state")
 async def get_initial_state(
     user: User = Depends(current_active_user),
-    group: Optional[Group] = Depends(get_active_group)
+    group: Optional[Group] = Depends(get_active_group),
+    curve: Optional[dict] = Depends(curve_options),
+    summary: bool = False,
 ):
-    """Fetches the complete initial state for a user upon login."""
+    """
+    Fetches the complete initial state for a user upon login, with the ID of the latest event it includes
+    for the client to open its stream from. `summary` asks for summary mode.
+    """
+    # Starts the replay logs of channels that have none, so the stream opened from here needn't resync
+    event_id = await resume_point(stream_channels(user.id, group.id if group else None))
     async for session in get_async_session():
-        relevant_user_objects: List[User] = []
-        user_ids_in_context: List[UUID] = []
+        return {**await build_initial_state(session, user, group, curve, summary), "lastEventId": event_id}
+
+
+async def stream_initial_state(
+    user: User, group: Optional[Group], curve: Optional[dict], summary: bool,
+) -> AsyncIterator[dict]:
+    """
+    The initial state as a sequence of records: an 'init' header, one 'member' record per member as their
+    snapshots are loaded in chunks, then the group's 'aggregate'. Only a chunk of members' drinks and states
+    is held at a time; the aggregate is built from compact per-member timelines.
+    """
+    event_id = await resume_point(stream_channels(user.id, group.id if group else None))
+    async for session in get_async_session():
+        members = await initial_members(session, user, group, summary)
+        # The user's own record comes first, so their view can render before the rest of the group arrives
+        members.sort(key=lambda member: member.id != user.id)
+
+        yield {
+            "type": "init", "mode": "summary" if summary else "full",
+            "self": {**user_profile(user, group), "isOwner": is_owner(user, user, group)},
+            "group": {"id": str(group.id), "name": group.name, "public": group.public} if group else None,
+            "memberCount": len(members), "lastEventId": event_id,
+        }
+
+        timelines = []
+        now = datetime.now(timezone.utc)
+        for start in range(0, len(members), COMPUTE_CHUNK_MEMBERS):
+            chunk = members[start:start + COMPUTE_CHUNK_MEMBERS]
+            snapshots = await load_snapshots(session, chunk, group)
+            for member in chunk:
+                snapshot = snapshots.pop(member.id)
+                timeline = BACTimeline.from_payload(snapshot["states"])
+                if group:
+                    timelines.append(timeline)
+
+                record = {
+                    "type": "member", "profile": {**snapshot["profile"], "isOwner": is_owner(member, user, group)},
+                    "version": snapshot["version"],
+                }
+                if summary and member.id != user.id:
+                    record["summary"] = member_summaries([snapshot["states"]], [len(snapshot["drinks"])], now)[0]
+                else:
+                    record["drinks"] = snapshot["drinks"]
+                    record["states"] = resample(timeline, **curve).to_payload() if curve else snapshot["states"]
+                yield record
+
+        if group:
+            aggregate = await compute_pool.run(aggregate_timelines_payload, timelines, size=len(timelines))
+            yield {"type": "aggregate", "aggregate": aggregate}
+
 
+@router.get("/initial-state/stream")
+async def get_initial_state_stream(
+    user: User = Depends(current_active_user),
+    group: Optional[Group] = Depends(get_active_group),
+    curve: Optional[dict] = Depends(curve_options),
+    summary: bool = False,
+):
+    """
+    The initial state as newline-delimited JSON, sent as it is built so clients can start rendering before a
+    big group has been loaded in full. See stream_initial_state for the records.
+    """
+    async def lines():
+        async for record in stream_initial_state(user, group, curve, summary):
+            yield json.dumps(record, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/members")
+async def get_members(
+    user_id: List[UUID] = Query(default=[]),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(REALTIME_MEMBER_PAGE_SIZE, ge=1, le=REALTIME_MEMBER_PAGE_SIZE),
+    user: User = Depends(current_active_user),
+    group: Optional[Group] = Depends(get_active_group),
+    curve: Optional[dict] = Depends(curve_options),
+):
+    """
+    Full snapshots of the active members of the user's group, in the same shape as 'update' messages, a page
+    at a time by display name. With `user_id`, only those members.
+    """
+    async for session in get_async_session():
         if group is None:
-            relevant_user_objects = [user]
-            user_ids_in_context = [user.id]
+            members = [user] if not user_id or user.id in user_id else []
+            total = len(members)
         else:
-            user_group_entries = await session.execute(
-                select(UserGroup)
-                .options(selectinload(UserGroup.user))
-                .where(UserGroup.group_id == group.id)
+            query = (
+                select(User)
+                .join(UserGroup, UserGroup.user_id == User.id)
+                .where(UserGroup.group_id == group.id, UserGroup.active.is_(True))
             )
-            relevant_user_objects = [ug.user for ug in user_group_entries.scalars().unique().all() if ug.user]
-            user_ids_in_context = [u.id for u in relevant_user_objects]
-
-        all_drinks_list: List[Drink] = []
-        if user_ids_in_context:
-            all_drinks_result = await session.execute(
-                select(Drink)
-                .where(Drink.user_id.in_(user_ids_in_context))
-                .order_by(Drink.add_time.asc())
-            )
-            all_drinks_list = all_drinks_result.scalars().all()
-
-        drinks_by_user = {}
-        for d in all_drinks_list:
-            drinks_by_user.setdefault(str(d.user_id), []).append({
-                "id": str(d.id), "nickname": d.nickname, "volume": d.volume,
-                "strength": d.strength, "time": d.add_time
-            })
-
-        members_list = []
-        for u in relevant_user_objects:
-            members_list.append({
-                "id": str(u.id), "displayName": u.display_name, "email": u.email,
-                "weight": u.weight, "gender": u.gender, "height": u.height,
-                "dob": u.dob.isoformat() if u.dob else None, "realDob": u.real_dob,
-                "isOwner": (group and group.owner_id == u.id) if group else (u.id == user.id),
-                "active": True,
-            })
-
-        states_by_user = {}
-        for u in relevant_user_objects:
-            age = (datetime.now(timezone.utc).date() - u.dob).days / 365.25
-            user_data = {"weight": u.weight, "gender": u.gender, "height": u.height, "age": age}
-            member_drinks = drinks_by_user.get(str(u.id), [])
-            states_by_user[str(u.id)] = drinks_to_bac(member_drinks, user_data)
-
-        self_profile = next((m for m in members_list if m["id"] == str(user.id)), None)
+            if user_id:
+                query = query.where(User.id.in_(user_id))
+            total = (await session.execute(select(func.count()).select_from(query.subquery()))).scalar_one()
+            result = await session.execute(query.order_by(User.display_name, User.id).offset(offset).limit(limit))
+            members = result.scalars().all()
+
+        snapshots = await load_snapshots(session, members, group)
+        page = []
+        for member in members:
+            snapshot = snapshots[member.id]
+            if curve:
+                snapshot["states"] = resample(BACTimeline.from_payload(snapshot["states"]), **curve).to_payload()
+            page.append({"type": "update", "user_id_updated": str(member.id), **snapshot})
+
+        return {"total": total, "offset": offset, "limit": limit, "members": page}
+
+
+@router.get("/snapshot/{user_id}")
+async def get_snapshot(
+    user_id: UUID,
+    user: User = Depends(current_active_user),
+    group: Optional[Group] = Depends(get_active_group),
+    curve: Optional[dict] = Depends(curve_options),
+):
+    """
+    Full snapshot of the user or a member of their active group, in the same shape as an 'update' message.
+    Clients fetch this to resync a member after missing one of their versions.
+    """
+    async for session in get_async_session():
+        target = await get_member(session, user, group, user_id)
+
+        snapshot = (await load_snapshots(session, [target], group))[target.id]
+        if curve:
+            snapshot["states"] = resample(BACTimeline.from_payload(snapshot["states"]), **curve).to_payload()
+
+        return {"type": "update", "user_id_updated": str(target.id), **snapshot}
 
+
+@router.get("/bac")
+async def get_bac_summary(
+    user_id: Optional[UUID] = None,
+    at: List[datetime] = Query(default=[]),
+    threshold: float = Query(LEGAL_LIMIT, gt=0),
+    user: User = Depends(current_active_user),
+    group: Optional[Group] = Depends(get_active_group),
+):
+    """Point-in-time BAC figures for the user, or a member of their active group, without the full state list."""
+    async for session in get_async_session():
+        target = await get_member(session, user, group, user_id)
+
+        drinks_result = await session.execute(
+            select(Drink).where(Drink.user_id == target.id).order_by(Drink.add_time.asc())
+        )
+        drinks = [
+            {"id": str(d.id), "volume": d.volume, "strength": d.strength, "time": d.add_time}
+            for d in drinks_result.scalars().all()
+        ]
+
+        checkpoint = get_checkpoint(target.id, bac_user_data(target))
+        checkpoint.sync(drinks)
+        timeline = checkpoint.timeline()
+
+        now = datetime.now(timezone.utc)
         return {
-            "type": "init", "self": self_profile,
-            "group": {"id": str(group.id), "name": group.name, "public": group.public} if group else None,
-            "members": members_list, "drinks": drinks_by_user, "states": states_by_user,
-        }
\ No newline at end of file
+            "userId": str(target.id), "time": now, "bac": timeline.bac_at(now),
+            "peak": timeline.peak(), "threshold": threshold,
+            "thresholdTime": timeline.time_to_threshold(threshold), "soberTime": timeline.sober_time(),
+            "at": [{"time": t, "bac": bac} for t, bac in zip(at, timeline.bac_at_many(at).tolist())],
+        }
+
+
+@router.get("/metrics")
+async def get_metrics(user: User = Depends(current_superuser)):
+    """Operational counters for this worker process."""
+    return {
+        "workQueue": work_queue.metrics(), "pubsub": hub.metrics(), "admission": stream_admission.metrics(),
+        "singleflight": {"snapshots": snapshot_builds.metrics(), "aggregates": aggregate_flights.metrics()},
+    }
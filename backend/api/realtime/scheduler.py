@@ -7,9 +7,11 @@ from sqlalchemy import select
 from api.auth.models import User
 from api.drinks.models import Drink, ArchivedDrink
 from api.core.db import get_async_session
-from api.realtime.calculations import drinks_to_bac
+from api.core.work_queue import work_queue
 from api.realtime.actions import update_user
-from api.utils import calculate_age
+from api.realtime.incremental import get_checkpoint
+from api.realtime.snapshots import invalidate_snapshot
+from api.utils import bac_user_data
 
 scheduler = AsyncIOScheduler()
 scheduler.start()
@@ -37,7 +39,9 @@ async def archive_if_sober(user_id: uuid.UUID):
 
         await session.commit()
 
-        await update_user(user)
+        await invalidate_snapshot(user_id)
+        # Queued like any other update, so it never runs alongside one already building for this user
+        work_queue.submit(user.id, "update", update_user, user)
 
 
 async def schedule_archive(user_id: uuid.UUID, task_time: datetime):
@@ -64,19 +68,14 @@ async def update_archival(user_id: uuid.UUID):
         if not drinks: return
 
         drinks_data = [
-            {"volume": d.volume, "strength": d.strength, "time": d.add_time}
+            {"id": str(d.id), "volume": d.volume, "strength": d.strength, "time": d.add_time}
             for d in drinks
         ]
-        age = calculate_age(user.dob, datetime.now(timezone.utc).date())
-        user_data = {
-            "weight": user.weight,
-            "gender": user.gender,
-            "height": user.height,
-            "age": age,
-        }
-
-        states = drinks_to_bac(drinks_data, user_data)
-        if not states: return
-
-        sober_time = states[-1]["time"]
+
+        # Shares the checkpoint kept up to date by update_user, so usually nothing is recomputed here
+        checkpoint = get_checkpoint(user_id, bac_user_data(user))
+        checkpoint.sync(drinks_data)
+        sober_time = checkpoint.sober_time
+        if sober_time is None: return
+
         await schedule_archive(user_id, sober_time)
\ No newline at end of file
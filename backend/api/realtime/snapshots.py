@@ -0,0 +1,182 @@
+import asyncio
+import json
+import time
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+
+from api.auth.models import User
+from api.config import REALTIME_SNAPSHOT_LOCK_SECONDS, REALTIME_SNAPSHOT_TTL
+from api.core.compute import compute_pool
+from api.core.db import redis_client
+from api.core.singleflight import SingleFlight
+from api.drinks.models import Drink
+from api.group.models import Group
+from api.realtime.calculations import batch_state_payloads
+from api.utils import bac_user_data
+
+
+def version_key(user_id: UUID) -> str:
+    """Redis key of the counter versioning a user's published snapshots."""
+    return f"realtime:version:{user_id}"
+
+
+def snapshot_key(user_id: UUID) -> str:
+    """Redis key of a user's cached snapshot."""
+    return f"realtime:snapshot:{user_id}"
+
+
+def user_profile(user: User, group: Optional[Group]) -> dict:
+    """The profile sent to clients for a user, as seen from their active group."""
+    return {
+        "id": str(user.id), "displayName": user.display_name, "email": user.email,
+        "weight": user.weight, "gender": user.gender, "height": user.height,
+        "dob": user.dob.isoformat() if user.dob else None, "realDob": user.real_dob,
+        "isOwner": (group and group.owner_id == user.id) if group else False, "active": True,
+    }
+
+
+async def store_snapshot(user_id: UUID, version: int, snapshot: dict):
+    """Cache a user's snapshot ('profile', 'drinks' and 'states') as of a version."""
+    await redis_client.set(snapshot_key(user_id), _encode(version, snapshot), ex=REALTIME_SNAPSHOT_TTL)
+
+
+async def invalidate_snapshot(user_id: UUID):
+    """Drop a user's cached snapshot after their drinks or profile changed."""
+    await redis_client.delete(snapshot_key(user_id))
+
+
+def _encode(version: int, snapshot: dict) -> str:
+    return json.dumps({"version": version, **snapshot}, default=str)
+
+
+async def load_snapshots(session, users: List[User], group: Optional[Group]) -> dict[UUID, dict]:
+    """
+    Snapshots of many users, read from the cache with one MGET.
+
+    A cached snapshot is used only while its version is still the user's latest, so one written by an update
+    that has since been superseded is never served. The rest are built together from one drinks query and one
+    batch BAC pass, then written back to the cache at the version read before building them. Snapshots already
+    being built by a concurrent call are awaited rather than built again, so a reconnect storm on a big group
+    builds each member once.
+
+    :return: Each user's snapshot with keys 'version', 'profile', 'drinks' and 'states'.
+    """
+
+    if not users:
+        return {}
+
+    cached = await redis_client.mget(
+        [version_key(u.id) for u in users] + [snapshot_key(u.id) for u in users]
+    )
+    versions = [int(v or 0) for v in cached[:len(users)]]
+
+    snapshots, missing = {}, []
+    for user, version, raw in zip(users, versions, cached[len(users):]):
+        snapshot = json.loads(raw) if raw else None
+        if snapshot is not None and snapshot["version"] == version:
+            snapshot["profile"] = user_profile(user, group)
+            snapshots[user.id] = snapshot
+        else:
+            missing.append((user, version))
+    if not missing:
+        return snapshots
+
+    users_by_id = {user.id: user for user, _ in missing}
+    led, following = snapshot_builds.claim([(user.id, version) for user, version in missing])
+    built = {}
+    try:
+        built = await _build_snapshots(session, [(users_by_id[uid], version) for uid, version in led], group)
+    finally:
+        snapshot_builds.settle(led, built)
+
+    # Anything a concurrent call failed to build is built here instead
+    leftovers = []
+    for (uid, version), flight in following.items():
+        snapshot = await SingleFlight.follow(flight)
+        if snapshot is None:
+            leftovers.append((users_by_id[uid], version))
+        else:
+            built[(uid, version)] = snapshot
+    if leftovers:
+        built.update(await _build_snapshots(session, leftovers, group))
+
+    for (uid, version), snapshot in built.items():
+        # Shared with the other callers, so each gets its own top level with its own view of the profile
+        snapshots[uid] = {**snapshot, "profile": user_profile(users_by_id[uid], group)}
+    return snapshots
+
+
+def _lock_key(user_id: UUID, version: int) -> str:
+    return f"realtime:snapshot-lock:{user_id}:{version}"
+
+
+async def _wait_for_other_workers(missing: list[tuple[User, int]]) -> tuple[dict, list, list[str]]:
+    """
+    Lock the snapshots about to be built across workers. Those another worker holds are waited for in the cache,
+    for up to REALTIME_SNAPSHOT_LOCK_SECONDS before giving up and building them anyway.
+    :return: The snapshots found, those still to build, and the locks taken.
+    """
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for user, version in missing:
+            pipe.set(_lock_key(user.id, version), 1, nx=True, ex=max(1, round(REALTIME_SNAPSHOT_LOCK_SECONDS)))
+        acquired = await pipe.execute()
+
+    mine = [m for m, ok in zip(missing, acquired) if ok]
+    theirs = [m for m, ok in zip(missing, acquired) if not ok]
+    found = {}
+    deadline = time.monotonic() + REALTIME_SNAPSHOT_LOCK_SECONDS
+    while theirs and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        waiting, theirs = theirs, []
+        for (user, version), raw in zip(waiting, await redis_client.mget([snapshot_key(u.id) for u, _ in waiting])):
+            snapshot = json.loads(raw) if raw else None
+            if snapshot is not None and snapshot["version"] == version:
+                found[(user.id, version)] = snapshot
+            else:
+                theirs.append((user, version))
+    return found, mine + theirs, [_lock_key(user.id, version) for user, version in mine]
+
+
+async def _build_snapshots(session, missing: list[tuple[User, int]], group: Optional[Group]) -> dict[tuple, dict]:
+    """Build and cache the snapshots of users at the given versions, keyed by (user ID, version)."""
+    if not missing:
+        return {}
+
+    built, locks = {}, []
+    if REALTIME_SNAPSHOT_LOCK_SECONDS > 0:
+        built, missing, locks = await _wait_for_other_workers(missing)
+        if not missing:
+            return built
+
+    drinks_result = await session.execute(
+        select(Drink)
+        .where(Drink.user_id.in_([u.id for u, _ in missing]))
+        .order_by(Drink.add_time.asc())
+    )
+    drinks_by_user = {}
+    for d in drinks_result.scalars().all():
+        drinks_by_user.setdefault(d.user_id, []).append({
+            "id": str(d.id), "nickname": d.nickname, "volume": d.volume,
+            "strength": d.strength, "time": d.add_time
+        })
+
+    member_drinks = [drinks_by_user.get(u.id, []) for u, _ in missing]
+    # Big batches are computed in chunks on the compute pool, keeping the event loop free meanwhile
+    member_states = await compute_pool.map_chunks(
+        batch_state_payloads, member_drinks, [bac_user_data(u) for u, _ in missing]
+    )
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for (user, version), drinks, states in zip(missing, member_drinks, member_states):
+            snapshot = {"profile": user_profile(user, group), "drinks": drinks, "states": states}
+            built[(user.id, version)] = {"version": version, **snapshot}
+            pipe.set(snapshot_key(user.id), _encode(version, snapshot), ex=REALTIME_SNAPSHOT_TTL)
+        if locks:
+            pipe.delete(*locks)
+        await pipe.execute()
+    return built
+
+
+# Snapshot builds in flight in this worker, by (user ID, version)
+snapshot_builds = SingleFlight()
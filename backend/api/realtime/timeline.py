@@ -0,0 +1,206 @@
+from datetime import datetime, timezone
+from typing import Iterable
+
+import numpy as np
+
+LEGAL_LIMIT = 0.08  # BAC
+
+
+def to_epoch(time: datetime) -> float:
+    """
+    Convert a datetime to epoch seconds, treating naive datetimes as UTC.
+    :param time: Datetime to convert.
+    :return: Seconds since the epoch.
+    """
+
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return time.timestamp()
+
+
+class BACTimeline:
+    """
+    Compact BAC timeline with point-in-time queries, equivalent to the states returned by drinks_to_bac.
+
+    The states are held as two parallel float arrays (epoch seconds and BAC) rather than a list of dicts. They are
+    breakpoints of a piecewise linear BAC curve (a drink is a vertical step, metabolism a straight decline), so
+    every query is a binary search over the sorted breakpoint times.
+    """
+
+    __slots__ = ("times", "bacs", "_peak_index", "_suffix_max")
+
+    def __init__(self, times: np.ndarray, bacs: np.ndarray):
+        """
+        :param times: Breakpoint times in epoch seconds, ascending.
+        :param bacs: BAC at each breakpoint.
+        """
+
+        assert len(times) == len(bacs), "Times and BACs must be the same length!"
+
+        self.times = np.asarray(times, dtype=np.float64)
+        self.bacs = np.asarray(bacs, dtype=np.float64)
+        self._peak_index = int(np.argmax(self.bacs)) if len(self.bacs) else None
+        self._suffix_max = None
+
+    @classmethod
+    def from_states(cls, states: list[dict]) -> "BACTimeline":
+        """Build a timeline from a list of {'time': datetime, 'bac': float} states."""
+        return cls(
+            np.fromiter((to_epoch(s["time"]) for s in states), dtype=np.float64, count=len(states)),
+            np.fromiter((s["bac"] for s in states), dtype=np.float64, count=len(states)),
+        )
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def to_states(self) -> list[dict]:
+        """The timeline as a list of {'time': datetime, 'bac': float} states, as returned by drinks_to_bac."""
+        return [
+            {'time': datetime.fromtimestamp(t, timezone.utc), 'bac': bac}
+            for t, bac in zip(self.times.tolist(), self.bacs.tolist())
+        ]
+
+    def to_payload(self) -> list[dict]:
+        """
+        The timeline as JSON-ready states, with times formatted as ISO 8601 UTC strings in one vectorised call
+        rather than one datetime per state.
+        """
+
+        times = np.datetime_as_string((self.times * 1000).astype("datetime64[ms]"), unit="ms", timezone="UTC")
+        return [{"time": t, "bac": bac} for t, bac in zip(times.tolist(), self.bacs.tolist())]
+
+    @classmethod
+    def from_payload(cls, states: list[dict]) -> "BACTimeline":
+        """Build a timeline back from the JSON states produced by to_payload."""
+        times = np.array([s["time"].rstrip("Z") for s in states], dtype="datetime64[ms]")
+        return cls(times.astype(np.int64) / 1000, np.array([s["bac"] for s in states], dtype=np.float64))
+
+    def bac_at(self, time: datetime | float) -> float:
+        """
+        BAC at a point in time, interpolating between breakpoints.
+        :param time: Datetime or epoch seconds.
+        :return: BAC, or 0.0 outside the timeline.
+        """
+
+        return float(self.bac_at_many([time])[0])
+
+    def bac_at_many(self, times: Iterable[datetime | float]) -> np.ndarray:
+        """BAC at each of many points in time, in one vectorised binary search."""
+        t = np.array([to_epoch(x) if isinstance(x, datetime) else x for x in times], dtype=np.float64)
+        if not len(self.times):
+            return np.zeros(len(t))
+
+        # Right at a drink the step up has already happened
+        i = np.searchsorted(self.times, t, side="right") - 1
+        inside = (i >= 0) & (i < len(self.times) - 1)
+        lo = np.clip(i, 0, len(self.times) - 1)
+        hi = np.clip(i + 1, 0, len(self.times) - 1)
+
+        t0, t1 = self.times[lo], self.times[hi]
+        b0, b1 = self.bacs[lo], self.bacs[hi]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            interpolated = b0 + (b1 - b0) * (t - t0) / (t1 - t0)
+        return np.where(inside, interpolated, np.where(i < 0, 0.0, b0))
+
+    def sample(self, start: datetime | float, end: datetime | float, points: int) -> "BACTimeline":
+        """
+        Fixed-resolution curve: the BAC at evenly spaced times across a window.
+        :param start: Start of the window, as a datetime or epoch seconds.
+        :param end: End of the window, as a datetime or epoch seconds.
+        :param points: Number of samples.
+        """
+
+        start = to_epoch(start) if isinstance(start, datetime) else start
+        end = to_epoch(end) if isinstance(end, datetime) else end
+        times = np.linspace(start, end, points)
+        return BACTimeline(times, self.bac_at_many(times))
+
+    def downsample(self, max_points: int) -> "BACTimeline":
+        """
+        Shape-preserving reduction to at most max_points breakpoints using Largest-Triangle-Three-Buckets.
+
+        The first and last breakpoints and the peak are always kept, so charts still show the session's start,
+        sobriety time and highest BAC.
+        """
+
+        n = len(self.times)
+        if n <= max_points or max_points < 3:
+            return self
+
+        x, y = self.times, self.bacs
+        # Interior breakpoints split into max_points - 2 buckets, one breakpoint picked from each
+        edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+        keep = [0]
+        for b in range(max_points - 2):
+            lo, hi = edges[b], edges[b + 1]
+            if b + 2 < len(edges):
+                next_x, next_y = x[hi:edges[b + 2]].mean(), y[hi:edges[b + 2]].mean()
+            else:
+                next_x, next_y = x[-1], y[-1]
+
+            a = keep[-1]
+            areas = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+            keep.append(lo + int(np.argmax(areas)))
+        keep.append(n - 1)
+
+        if self._peak_index not in keep:
+            bucket = int(np.searchsorted(edges, self._peak_index, side="right"))
+            keep[bucket] = self._peak_index
+
+        keep = np.array(keep)
+        return BACTimeline(x[keep], y[keep])
+
+    def peak(self) -> dict | None:
+        """The highest BAC of the timeline as {'time': datetime, 'bac': float}, or None if it is empty."""
+        if self._peak_index is None:
+            return None
+        return {"time": _to_datetime(self.times[self._peak_index]), "bac": float(self.bacs[self._peak_index])}
+
+    def time_to_threshold(self, threshold: float = LEGAL_LIMIT) -> datetime | None:
+        """
+        When the BAC last falls below a threshold and stays below it.
+        :param threshold: BAC threshold, e.g. the legal driving limit.
+        :return: Datetime of the crossing, or None if the timeline never reaches the threshold.
+        """
+
+        if self._suffix_max is None:
+            # Suffix maxima are non-increasing, which makes threshold crossings binary searchable
+            self._suffix_max = np.maximum.accumulate(self.bacs[::-1])[::-1]
+
+        # Last breakpoint at or above the threshold
+        i = len(self._suffix_max) - int(np.searchsorted(self._suffix_max[::-1], threshold, side="left")) - 1
+        if i < 0:
+            return None
+        if i == len(self.times) - 1:
+            return _to_datetime(self.times[i])
+
+        t0, t1 = self.times[i], self.times[i + 1]
+        b0, b1 = self.bacs[i], self.bacs[i + 1]
+        return _to_datetime(t0 + (t1 - t0) * (b0 - threshold) / (b0 - b1))
+
+    def sober_time(self) -> datetime | None:
+        """When the BAC returns to zero, or None if the timeline is empty."""
+        return _to_datetime(self.times[-1]) if len(self.times) else None
+
+
+def _to_datetime(time: float) -> datetime:
+    return datetime.fromtimestamp(float(time), timezone.utc)
+
+
+def resample(timeline: BACTimeline, points: int, start: datetime | float | None = None,
+             end: datetime | float | None = None) -> BACTimeline:
+    """
+    Reduce a timeline to a chart-sized curve of `points` points.
+    Samples at a fixed resolution when a window is given, otherwise downsamples preserving the curve's shape.
+    Naive datetimes are taken as UTC, and a window ending before it starts has no samples.
+    """
+
+    if start is None and end is None:
+        return timeline.downsample(points)
+    if not len(timeline):
+        return timeline
+    start = timeline.times[0] if start is None else to_epoch(start) if isinstance(start, datetime) else start
+    end = timeline.times[-1] if end is None else to_epoch(end) if isinstance(end, datetime) else end
+    if start > end:
+        return BACTimeline(np.empty(0), np.empty(0))
+    return timeline.sample(start, end, points)
@@ -1,4 +1,4 @@
-from datetime import date
+from datetime import date, datetime, timezone
 
 
 def calculate_age(dob: date, today: date | None = None) -> int:
@@ -6,3 +6,9 @@ def calculate_age(dob: date, today: date | None = None) -> int:
     if today is None:
         today = date.today()
     return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+
+
+def bac_user_data(user) -> dict:
+    """Return the body parameters used for a user's BAC calculations."""
+    age = (datetime.now(timezone.utc).date() - user.dob).days / 365.25
+    return {"weight": user.weight, "gender": user.gender, "height": user.height, "age": age}
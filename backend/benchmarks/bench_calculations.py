@@ -0,0 +1,192 @@
+"""
+Benchmarks for api.realtime.calculations on synthetic drinking sessions.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_calculations                      # compare against benchmarks/baseline.json
+    python -m benchmarks.bench_calculations --quick              # skip the largest cases
+    python -m benchmarks.bench_calculations --update-baseline    # record a new baseline
+
+Timings are divided by a fixed pure-Python calibration loop before being compared, so a baseline recorded on one
+machine stays meaningful on another. Exits with status 1 if any case is slower than the baseline by more than the
+tolerance.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api.realtime.calculations import (  # noqa: E402
+    batch_bac_timelines,
+    batch_drinks_to_bac,
+    drink_to_bac,
+    drinks_to_bac,
+    get_bac,
+    pack_drinks,
+)
+from api.realtime.incremental import IncrementalBAC  # noqa: E402
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+START = datetime(2025, 1, 1, 20, 0, tzinfo=timezone.utc)
+RATES = {"slow": 0.01, "average": 0.015, "fast": 0.025}
+DRINK_TYPES = [(500.0, 0.05), (330.0, 0.045), (175.0, 0.12), (25.0, 0.4), (250.0, 0.0)]
+
+
+def synthetic_user(rng: random.Random) -> dict:
+    return {
+        "weight": rng.uniform(50.0, 110.0),
+        "height": rng.choice([None, rng.uniform(155.0, 195.0)]),
+        "age": rng.uniform(18.0, 60.0),
+        "gender": rng.choice(["MALE", "FEMALE"]),
+    }
+
+
+def synthetic_session(n_drinks: int, rng: random.Random) -> list[dict]:
+    """A chronologically ordered session with realistic gaps, including breaks long enough to sober up."""
+    drinks = []
+    t = START
+    for i in range(n_drinks):
+        t += timedelta(minutes=rng.choice([0, 5, 15, 30, 45, 60, 600]))
+        volume, strength = rng.choice(DRINK_TYPES)
+        drinks.append({"id": str(i), "time": t, "volume": volume, "strength": strength})
+    return drinks
+
+
+def measure(func, min_time: float = 0.2, repeats: int = 3) -> float:
+    """Best-of-`repeats` seconds per call, looping each repeat for at least `min_time` seconds."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+
+    best = elapsed / number
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def calibration():
+    total = 0.0
+    for i in range(100_000):
+        total += i * 0.5
+    return total
+
+
+def build_cases(quick: bool) -> dict:
+    # Every case gets its own seed so the data doesn't depend on which other cases run
+    user = synthetic_user(random.Random(42))
+    cases = {}
+
+    cases["get_bac"] = lambda: get_bac(500.0, 0.05, 70.0, "MALE", age=30.0, height=180.0)
+    drink = {"time": START, "volume": 500.0, "strength": 0.05}
+    cases["drink_to_bac"] = lambda: drink_to_bac(drink, user)
+
+    for n in [10, 100, 1_000, 10_000] + ([] if quick else [100_000]):
+        session = synthetic_session(n, random.Random(n))
+        cases[f"drinks_to_bac/single_rate/{n}"] = lambda s=session: drinks_to_bac(s, user)
+        cases[f"drinks_to_bac/rate_dict/{n}"] = lambda s=session: drinks_to_bac(s, user, RATES)
+
+    for members in [1, 10, 100] + ([] if quick else [1_000]):
+        rng = random.Random(members)
+        sessions = [synthetic_session(rng.randint(0, 40), rng) for _ in range(members)]
+        users = [synthetic_user(rng) for _ in range(members)]
+        packed = pack_drinks(sessions, users)
+        cases[f"group/reference_loop/{members}"] = \
+            lambda s=sessions, u=users: [drinks_to_bac(d, p) for d, p in zip(s, u)]
+        cases[f"group/pack/{members}"] = lambda s=sessions, u=users: pack_drinks(s, u)
+        cases[f"group/batch/{members}"] = lambda p=packed: batch_drinks_to_bac(**p)
+        cases[f"group/batch_timelines/{members}"] = lambda p=packed: batch_bac_timelines(**p)
+        cases[f"group/batch_rate_dict/{members}"] = lambda p=packed: batch_drinks_to_bac(**p, metabolism_rate=RATES)
+
+    # Adding then removing the latest drink of a long session, both at the end of the checkpoint
+    session = synthetic_session(1_000, random.Random(0))
+    checkpoint = IncrementalBAC(user)
+    checkpoint.sync(session[:-1])
+    cases["incremental/append_remove/1000"] = \
+        lambda: (checkpoint.add(session[-1]), checkpoint.remove(session[-1]["id"]))
+    return cases
+
+
+def run(quick: bool) -> dict:
+    unit = measure(calibration)
+    results = {}
+    for name, func in build_cases(quick).items():
+        seconds = measure(func)
+        results[name] = {"seconds": seconds, "relative": seconds / unit}
+        print(f"{name:45s} {seconds * 1e3:12.4f} ms")
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "calibration_seconds": unit,
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Names of the cases whose calibrated time regressed beyond the tolerance."""
+    regressions = []
+    for name, result in report["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        ratio = result["relative"] / reference["relative"]
+        status = "REGRESSION" if ratio > tolerance else "ok"
+        print(f"{name:45s} {ratio:8.2f}x baseline  {status}")
+        if ratio > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="skip the 100k drink and 1000 member cases")
+    parser.add_argument("--output", type=Path, help="write the JSON report to this file")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="overwrite the baseline with this run")
+    parser.add_argument("--tolerance", type=float, default=2.0,
+                        help="fail when a case is this many times slower than the baseline (default 2.0)")
+    args = parser.parse_args(argv)
+
+    report = run(args.quick)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one.")
+        return 0
+
+    regressions = compare(report, json.loads(args.baseline.read_text()), args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed beyond {args.tolerance}x: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Idle CPU and publish-to-client latency of SSE delivery, polling versus push.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_sse                       # 1000 connections
+    python -m benchmarks.bench_sse --connections 5000 --idle 10
+
+Both modes run many simulated connections in this process on the real pub/sub hub, fed by an in-memory broker
+instead of Redis. 'poll' replays the old event generator loop: get_message(timeout=1), an is_disconnected check
+and a 10 ms sleep per iteration. 'push' drives api.realtime.router.relay_messages, which awaits each message.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from api.realtime import hub as hub_module, presence  # noqa: E402
+from api.realtime.router import relay_messages  # noqa: E402
+
+CHANNEL = "sse:group:bench"
+
+
+class MemoryPubSub:
+    def __init__(self, broker):
+        self.broker = broker
+        self.channels = set()
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            return await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def aclose(self):
+        pass
+
+
+class MemoryPipeline:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def set(self, key, value, ex=None):
+        pass
+
+    async def execute(self):
+        pass
+
+
+class MemoryBroker:
+    def __init__(self):
+        self.pubsubs = []
+
+    def pipeline(self, transaction=True):
+        return MemoryPipeline()
+
+    def pubsub(self):
+        pubsub = MemoryPubSub(self)
+        self.pubsubs.append(pubsub)
+        return pubsub
+
+    async def publish(self, channel, data):
+        for pubsub in self.pubsubs:
+            if channel in pubsub.channels:
+                pubsub.messages.put_nowait({"type": "message", "channel": channel, "data": data})
+
+
+class IdleRequest:
+    async def is_disconnected(self):
+        await asyncio.sleep(0)
+        return False
+
+
+async def poll_messages(subscription, own_channel, request):
+    """The SSE loop as it was before push delivery."""
+    while True:
+        if await request.is_disconnected():
+            break
+        message = await subscription.get_message(timeout=1)
+        if message:
+            yield {"data": message["data"]}
+        await asyncio.sleep(0.01)
+
+
+async def run_mode(mode: str, connections: int, idle: float, messages: int) -> dict:
+    broker = MemoryBroker()
+    hub_module.redis_client = presence.redis_client = broker
+    hub = hub_module.PubSubHub()
+    latencies = []
+
+    async def client(n):
+        subscription = hub.subscription()
+        await subscription.subscribe(CHANNEL, f"sse:{n}")
+        if mode == "poll":
+            events = poll_messages(subscription, f"sse:{n}", IdleRequest())
+        else:
+            events = relay_messages(subscription, f"sse:{n}")
+        async for event in events:
+            latencies.append(time.perf_counter() - json.loads(event["data"])["sent"])
+
+    tasks = [asyncio.create_task(client(n)) for n in range(connections)]
+    await asyncio.sleep(0.5)  # let every connection subscribe and settle
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    await asyncio.sleep(idle)
+    idle_cpu = (time.process_time() - cpu) / (time.perf_counter() - wall)
+
+    for _ in range(messages):
+        await broker.publish(CHANNEL, json.dumps({"type": "update", "sent": time.perf_counter()}))
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(1.2)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await hub.close()
+
+    latencies.sort()
+    return {
+        "idle_cpu_percent": idle_cpu * 100,
+        "delivered": len(latencies),
+        "latency_p50_ms": statistics.median(latencies) * 1e3 if latencies else None,
+        "latency_p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1e3 if latencies else None,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=1000, help="simulated SSE connections (default 1000)")
+    parser.add_argument("--idle", type=float, default=5.0, help="seconds of idle time to measure (default 5)")
+    parser.add_argument("--messages", type=int, default=20, help="messages published to every connection")
+    parser.add_argument("--output", type=Path, help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = {}
+    for mode in ("poll", "push"):
+        report[mode] = asyncio.run(run_mode(mode, args.connections, args.idle, args.messages))
+        result = report[mode]
+        print(f"{mode:5s} idle CPU {result['idle_cpu_percent']:6.1f}%   "
+              f"latency p50 {result['latency_p50_ms']:8.2f} ms   p99 {result['latency_p99_ms']:8.2f} ms   "
+              f"({result['delivered']} deliveries)")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    """
+    Point the database engine at a test database, for tests importing modules that create it on import. Set
+    only if unset, as the engine is created once per session with the settings of whichever test imports it
+    first, such as test_api's.
+    """
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path/'test.db'}")
+    return os.environ["DATABASE_URL"]
+
+
+@pytest.fixture
+def actions(database_url):
+    from api.realtime import actions
+    return actions
@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from api.realtime.admission import StreamAdmission  # noqa: E402
+
+
+def test_bucket_admits_burst_then_refuses():
+    admission = StreamAdmission(rate=1, burst=3, retry_ms=1000)
+    assert [admission.admit() for _ in range(5)] == [True, True, True, False, False]
+
+    metrics = admission.metrics()
+    assert metrics["accepted"] == 3
+    assert metrics["rejected"] == 2
+    assert metrics["tokens"] < 1
+
+
+def test_bucket_refills_over_time(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("api.realtime.admission.time.monotonic", lambda: clock[0])
+    admission = StreamAdmission(rate=2, burst=2, retry_ms=1000)
+
+    assert admission.admit() and admission.admit()
+    assert not admission.admit()
+    clock[0] += 0.5
+    assert admission.admit()
+    assert not admission.admit()
+    clock[0] += 10
+    # Never more than a burst at once, however long it has been idle
+    assert [admission.admit() for _ in range(3)] == [True, True, False]
+
+
+def test_retry_after_spreads_with_refusals():
+    admission = StreamAdmission(rate=1, burst=1, retry_ms=1000)
+    assert admission.retry_after() == 1
+
+    admission.admit()
+    for _ in range(100):
+        admission.admit()
+    hints = {admission.retry_after() for _ in range(200)}
+    assert min(hints) >= 1
+    assert max(hints) <= 101
+    assert len(hints) > 10
+
+
+def test_retry_delay_is_jittered_and_grows_under_pressure():
+    admission = StreamAdmission(rate=1, burst=10, retry_ms=1000)
+    idle = [admission.retry_delay_ms() for _ in range(200)]
+    assert all(500 <= delay <= 1500 for delay in idle)
+    assert len(set(idle)) > 10
+
+    for _ in range(10):
+        admission.admit()
+    busy = [admission.retry_delay_ms() for _ in range(200)]
+    assert min(busy) > 1500
+    assert max(busy) <= 7500
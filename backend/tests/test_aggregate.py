@@ -0,0 +1,50 @@
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from api.realtime.aggregate import aggregate_payload, aggregate_timelines
+from api.realtime.calculations import drinks_to_bac
+from api.realtime.timeline import BACTimeline, LEGAL_LIMIT, to_epoch
+
+START = datetime(2021, 9, 1, 20, 0, tzinfo=timezone.utc)
+
+
+def _member_timelines(members: int, seed: int = 0) -> list[BACTimeline]:
+    rng = random.Random(seed)
+    timelines = []
+    for _ in range(members):
+        drinks, t = [], START + timedelta(minutes=rng.randint(0, 120))
+        for _ in range(rng.randint(0, 8)):
+            t += timedelta(minutes=rng.choice([0, 10, 30, 90, 400]))
+            drinks.append({"time": t, "volume": rng.choice([25.0, 330.0, 500.0]), "strength": rng.choice([0.05, 0.4])})
+        user = {"weight": rng.uniform(50, 100), "height": 175.0, "age": 30.0, "gender": rng.choice(["MALE", "FEMALE"])}
+        timelines.append(BACTimeline.from_states(drinks_to_bac(drinks, user)))
+    return timelines
+
+
+def test_aggregate_matches_members_at_every_moment():
+    timelines = _member_timelines(25)
+    aggregate = aggregate_timelines(timelines)
+    assert np.all(np.diff(aggregate["times"]) >= 0)
+
+    times = np.linspace(to_epoch(START) - 600, to_epoch(START) + 86400, 2000)
+    bacs = np.array([t.bac_at_many(times) for t in timelines])
+
+    # The max and mean are exact piecewise linear curves, the count a step function
+    assert np.interp(times, aggregate["times"], aggregate["max"]) == pytest.approx(bacs.max(axis=0), abs=1e-9)
+    assert np.interp(times, aggregate["times"], aggregate["mean"]) == pytest.approx(bacs.mean(axis=0), abs=1e-9)
+    latest = np.searchsorted(aggregate["times"], times, side="right") - 1
+    over = np.where(latest >= 0, aggregate["over"][np.clip(latest, 0, None)], 0)
+    assert over.tolist() == (bacs >= LEGAL_LIMIT).sum(axis=0).tolist()
+
+
+def test_aggregate_of_empty_group():
+    aggregate = aggregate_timelines(_member_timelines(0))
+    assert len(aggregate["times"]) == 0
+    assert aggregate_payload(aggregate) == {"threshold": LEGAL_LIMIT, "times": [], "max": [], "mean": [], "over": []}
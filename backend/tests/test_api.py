@@ -1,6 +1,10 @@
+import asyncio
+import json
 import os
 import sys
 import pathlib
+import time
+import uuid
 import httpx
 import pytest
 from asgi_lifespan import LifespanManager
@@ -10,17 +14,149 @@ sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
 
 
 class DummyRedis:
-    async def publish(self, *args, **kwargs):
+    def __init__(self):
+        self.published = []
+        self.values = {}
+        self.pubsubs = []
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        for pubsub in self.pubsubs:
+            if channel in pubsub.channels:
+                pubsub.messages.put_nowait({"type": "message", "channel": channel, "data": message})
+
+    def pubsub(self):
+        pubsub = DummyPubSub(self)
+        self.pubsubs.append(pubsub)
+        return pubsub
+
+    async def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+    async def exists(self, *keys):
+        return sum(key in self.values for key in keys)
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def hgetall(self, key):
+        return dict(self.values.get(key, {}))
+
+    async def hsetnx(self, key, field, value):
+        fields = self.values.setdefault(key, {})
+        if field in fields:
+            return 0
+        fields[field] = str(value)
+        return 1
+
+    async def expire(self, key, seconds):
+        self.expiring = getattr(self, "expiring", {})
+        self.expiring[key] = seconds
+        return key in self.values
+
+    async def xrange(self, key, min="-", max="+"):
+        start = int(min.split("-")[0]) if min != "-" else 0
+        return [(entry_id, fields) for entry_id, fields in self.values.get(key, []) if int(entry_id.split("-")[0]) >= start]
+
+    def register_script(self, script):
+        from api.realtime import events
+        return DummyPublishScript(self) if script == events.PUBLISH_SCRIPT else DummySkipScript(self)
+
+    async def mget(self, keys):
+        return [self.values.get(k) for k in keys]
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return DummyPipeline(self)
+
+
+class DummyPublishScript:
+    """Stands in for api.realtime.events.PUBLISH_SCRIPT, the only script the app registers."""
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def __call__(self, keys, args):
+        counter, stream, meta = keys
+        channel, message, max_length, *_ttls = args
+        event_id = await self.redis.incr(counter)
+        entries = self.redis.values.setdefault(stream, [])
+        meta_fields = self.redis.values.setdefault(meta, {})
+        entries.append((f"{event_id}-0", {"data": message}))
+        while len(entries) > max_length:
+            meta_fields["trimmed"] = entries.pop(0)[0].split("-")[0]
+        meta_fields["last"] = str(event_id)
+        await self.redis.publish(channel, f"{event_id} {message}")
+        return event_id
+
+
+class DummySkipScript:
+    """Stands in for api.realtime.events.SKIP_SCRIPT."""
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def __call__(self, keys, args=()):
+        counter, meta = keys
+        event_id = await self.redis.incr(counter)
+        self.redis.values.setdefault(meta, {}).update(trimmed=str(event_id), last=str(event_id))
+        return event_id
+
+
+class DummyPubSub:
+    def __init__(self, redis):
+        self.redis = redis
+        self.channels = set()
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=None):
+        return await asyncio.wait_for(self.messages.get(), timeout)
+
+    async def aclose(self):
+        self.redis.pubsubs.remove(self)
+
+
+class DummyPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
         pass
 
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
 
 @pytest.fixture
 def anyio_backend():
     return "asyncio"
 
 
-@pytest.fixture
-async def client(tmp_path):
+def _app(tmp_path):
+    """The app with a fresh DummyRedis in place of Redis everywhere it is imported."""
     os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp_path/'test.db'}"
     os.environ["REDIS_URL"] = "redis://localhost"
     apscheduler.schedulers.asyncio.AsyncIOScheduler.start = lambda self: None
@@ -32,14 +168,25 @@ async def client(tmp_path):
     rt_actions.redis_client = core_db.redis_client
     from api.realtime import scheduler as rt_scheduler
     rt_scheduler.redis_client = core_db.redis_client
+    from api.realtime import snapshots as rt_snapshots
+    rt_snapshots.redis_client = core_db.redis_client
+    from api.realtime import events as rt_events
+    rt_events.redis_client = core_db.redis_client
+    from api.realtime import presence as rt_presence
+    rt_presence.redis_client = core_db.redis_client
+    from api.realtime import hub as rt_hub
+    rt_hub.redis_client = core_db.redis_client
     async def _noop(*args, **kwargs):
         pass
     rt_scheduler.update_archival = _noop
 
     from api.index import app
+    return app
 
-    await core_db.create_db_and_tables()
 
+@pytest.fixture
+async def client(tmp_path):
+    app = _app(tmp_path)
     transport = httpx.ASGITransport(app=app)
     async with LifespanManager(app):
         async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
@@ -99,6 +246,13 @@ async def test_auth_and_flows(client):
     r = await client.post(f"/group/join/{group_id}", headers=headers2)
     assert r.status_code == 200
 
+    # The member's open streams are told to follow them onto the group channel
+    member_id = (await client.get("/auth/users/me", headers=headers2)).json()["id"]
+    from api.core import db as core_db
+    channel, message = core_db.redis_client.published[-1]
+    assert channel == f"sse:{member_id}"
+    assert json.loads(message) == {"type": "subscribe", "group_id": group_id}
+
     drink = {
         "nickname": "beer",
         "volume": 500,
@@ -112,6 +266,11 @@ async def test_auth_and_flows(client):
     assert r.status_code == 200
     assert len(r.json()) == 1
 
+    r = await client.get("/realtime/initial-state", headers=headers1)
+    assert r.status_code == 200
+    aggregate = r.json()["aggregate"]
+    assert len(aggregate["times"]) == len(aggregate["max"]) == len(aggregate["mean"]) == len(aggregate["over"])
+
     r = await client.delete("/drinks/last", headers=headers2)
     assert r.status_code == 200
 
@@ -167,3 +326,295 @@ async def test_update_and_delete_drink(client):
     r = await client.get("/drinks/mine", headers=headers)
     assert r.status_code == 200
     assert len(r.json()) == 0
+
+
+@pytest.mark.anyio
+async def test_realtime_bac_summary(client):
+    user = {
+        "email": "drinker@example.com",
+        "password": "secret",
+        "display_name": "drinker",
+        "weight": 70,
+        "gender": "male",
+        "height": 175,
+        "dob": "1990-01-01",
+        "real_dob": True,
+    }
+    assert (await _register(client, user)).status_code == 201
+    token = (await _login(client, user["email"], user["password"])).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    drink = {"nickname": "shot", "volume": 100, "strength": 0.4}
+    r = await client.post("/drinks", json=drink, headers=headers)
+    assert r.status_code == 200
+
+    r = await client.get("/realtime/bac", params={"threshold": 0.01}, headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert body["bac"] > 0
+    assert body["peak"]["bac"] >= body["bac"]
+    assert body["thresholdTime"] is not None
+    assert body["soberTime"] is not None
+
+    r = await client.get("/realtime/initial-state", params={"points": 3}, headers=headers)
+    assert r.status_code == 200
+    assert len(r.json()["states"][body["userId"]]) == 3
+    assert list(r.json()["versions"]) == [body["userId"]]
+
+    r = await client.get(f"/realtime/snapshot/{body['userId']}", headers=headers)
+    assert r.status_code == 200
+    snapshot = r.json()
+    assert snapshot["type"] == "update" and isinstance(snapshot["version"], int)
+    assert len(snapshot["drinks"]) == 1 and snapshot["states"][-1]["bac"] == 0.0
+
+    # Snapshots are cached on read and dropped when the drinks change
+    from api.core import db as core_db
+    key = f"realtime:snapshot:{body['userId']}"
+    assert json.loads(core_db.redis_client.values[key])["states"] == snapshot["states"]
+    r = await client.get("/realtime/initial-state", headers=headers)
+    assert r.json()["states"][body["userId"]] == snapshot["states"]
+    r = await client.delete("/drinks/last", headers=headers)
+    assert r.status_code == 200
+    assert key not in core_db.redis_client.values
+
+    r = await client.get("/realtime/bac", params={"user_id": str(uuid.uuid4())}, headers=headers)
+    assert r.status_code == 404
+    r = await client.get(f"/realtime/snapshot/{uuid.uuid4()}", headers=headers)
+    assert r.status_code == 404
+
+    # Worker metrics are for superusers only
+    r = await client.get("/realtime/metrics", headers=headers)
+    assert r.status_code == 403
+
+
+@pytest.mark.anyio
+async def test_reconnect_replays_missed_events(client, monkeypatch):
+    from api.realtime import events
+
+    monkeypatch.setattr(events, "REALTIME_REPLAY_LENGTH", 3)
+    for n in range(3):
+        await events.publish_event("sse:group:a", json.dumps({"n": n}))
+    await events.publish_event("sse:b", json.dumps({"n": 3}))
+
+    # Only what came after the client's last event, across all of its channels, in order
+    replayed = await events.replay_events(["sse:b", "sse:group:a"], 1)
+    assert [event_id for event_id, _ in replayed] == [2, 3, 4]
+    assert json.loads(replayed[0][1]) == {"n": 1}
+    assert await events.replay_events(["sse:b", "sse:group:a"], 4) == []
+
+    # Too far behind once the capped log has dropped events the client never saw
+    await events.publish_event("sse:group:a", json.dumps({"n": 4}))
+    assert await events.replay_events(["sse:group:a"], 0) is None
+    assert [event_id for event_id, _ in await events.replay_events(["sse:group:a"], 2)] == [3, 5]
+    # IDs the server never issued, e.g. from before Redis was reset
+    assert await events.replay_events(["sse:group:a"], 99) is None
+
+    # A channel whose meta has expired may have lost events, so the client resyncs once and is then covered
+    from api.core import db as core_db
+    assert core_db.redis_client.expiring[events.replay_meta_key("sse:group:a")] > events.REALTIME_REPLAY_TTL
+    del core_db.redis_client.values[events.replay_meta_key("sse:b")]
+    assert await events.replay_events(["sse:b", "sse:group:a"], 4) is None
+    assert await events.replay_events(["sse:b", "sse:group:a"], 5) == []
+    await events.publish_event("sse:b", json.dumps({"n": 5}))
+    assert await events.replay_events(["sse:b", "sse:group:a"], 5) == [(6, json.dumps({"n": 5}))]
+    # Nothing can have been missed by a client already at the latest event
+    assert await events.replay_events(["sse:never-published"], 6) == []
+
+    user = {"email": "replay@example.com", "password": "secret", "display_name": "replay", "weight": 70,
+            "gender": "male", "height": 170, "dob": "1990-01-01", "real_dob": True}
+    await _register(client, user)
+    token = (await _login(client, user["email"], user["password"])).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    r = await client.get("/realtime/initial-state", headers=headers)
+    last_event_id = r.json()["lastEventId"]
+    assert last_event_id >= 5
+    # The user's channel was never published to, but initial-state starts its log from the ID it hands out, so
+    # whatever is published before the stream opens is replayed rather than sending the client to resync
+    channel = f"sse:{(await client.get('/auth/users/me', headers=headers)).json()['id']}"
+    await events.publish_event("sse:group:a", json.dumps({"n": 6}))
+    await events.publish_event(channel, json.dumps({"n": 7}))
+    replayed = await events.replay_events([channel], last_event_id)
+    assert [json.loads(data) for _, data in replayed] == [{"n": 7}]
+
+
+@pytest.mark.anyio
+async def test_updates_are_only_published_to_watched_channels(client):
+    import asyncio
+    from api.core import db as core_db
+    from api.realtime import events
+
+    user = {"email": "watcher@example.com", "password": "secret", "display_name": "watcher", "weight": 70,
+            "gender": "male", "height": 170, "dob": "1990-01-01", "real_dob": True}
+    await _register(client, user)
+    token = (await _login(client, user["email"], user["password"])).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    channel = f"sse:{(await client.get('/auth/users/me', headers=headers)).json()['id']}"
+    drink = {"nickname": "beer", "volume": 500, "strength": 0.05, "add_time": "2025-01-01T00:00:00Z"}
+    redis = core_db.redis_client
+
+    await client.post("/drinks", json=drink, headers=headers)
+    await asyncio.sleep(0.5)
+    assert not [m for c, m in redis.published if c == channel]
+    # Anyone resuming from before the skipped update is sent to resync
+    assert await events.replay_events([channel], 0) is None
+
+    redis.values[f"presence:{channel}"] = "1"
+    await client.post("/drinks", json=drink, headers=headers)
+    await asyncio.sleep(0.5)
+    (published,) = [m for c, m in redis.published if c == channel]
+    assert json.loads(events.parse_event(published)[1])["type"] == "update"
+    assert len((await client.get("/realtime/initial-state", headers=headers)).json()["drinks"]) == 1
+
+
+@pytest.mark.anyio
+async def test_summary_mode_defers_member_detail(client):
+    user = {"email": "summary@example.com", "password": "secret", "display_name": "summary", "weight": 70,
+            "gender": "male", "height": 170, "dob": "1990-01-01", "real_dob": True}
+    await _register(client, user)
+    token = (await _login(client, user["email"], user["password"])).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    me = (await client.get("/auth/users/me", headers=headers)).json()["id"]
+    drink = {"nickname": "beer", "volume": 500, "strength": 0.05, "add_time": "2025-01-01T00:00:00Z"}
+    await client.post("/drinks", json=drink, headers=headers)
+
+    r = await client.get("/realtime/initial-state", params={"summary": "true"}, headers=headers)
+    body = r.json()
+    assert body["mode"] == "summary"
+    assert body["summaries"][me]["drinkCount"] == 1
+    assert body["summaries"][me]["peak"] > 0
+    assert set(body["states"]) == set(body["versions"]) == {me}
+
+    r = await client.get("/realtime/initial-state", headers=headers)
+    assert r.json()["mode"] == "full" and r.json()["summaries"] is None
+
+    r = await client.get("/realtime/members", params={"user_id": me}, headers=headers)
+    page = r.json()
+    assert page["total"] == 1
+    assert page["members"][0]["user_id_updated"] == me and len(page["members"][0]["drinks"]) == 1
+    r = await client.get("/realtime/members", params={"user_id": str(uuid.uuid4())}, headers=headers)
+    assert r.json()["total"] == 0 and r.json()["members"] == []
+
+
+@pytest.mark.anyio
+async def test_initial_state_streams_one_record_per_member(client):
+    user = {"email": "stream@example.com", "password": "secret", "display_name": "stream", "weight": 70,
+            "gender": "male", "height": 170, "dob": "1990-01-01", "real_dob": True}
+    await _register(client, user)
+    token = (await _login(client, user["email"], user["password"])).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    drink = {"nickname": "beer", "volume": 500, "strength": 0.05, "add_time": "2025-01-01T00:00:00Z"}
+    await client.post("/drinks", json=drink, headers=headers)
+
+    r = await client.get("/realtime/initial-state/stream", headers=headers)
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    header, member = [json.loads(line) for line in r.text.splitlines()]
+
+    full = (await client.get("/realtime/initial-state", headers=headers)).json()
+    assert header["type"] == "init" and header["memberCount"] == 1
+    assert header["self"] == full["self"]
+    assert member["type"] == "member" and member["profile"]["id"] == full["self"]["id"]
+    assert member["states"] == full["states"][full["self"]["id"]]
+    assert len(member["drinks"]) == 1
+
+
+@pytest.mark.anyio
+async def test_snapshot_locked_by_another_worker_is_awaited(client, monkeypatch):
+    import asyncio
+    from api.core import db as core_db
+    from api.realtime import snapshots
+
+    user = {"email": "herd@example.com", "password": "secret", "display_name": "herd", "weight": 70,
+            "gender": "male", "height": 170, "dob": "1990-01-01", "real_dob": True}
+    await _register(client, user)
+    token = (await _login(client, user["email"], user["password"])).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    me = (await client.get("/auth/users/me", headers=headers)).json()["id"]
+
+    # Another worker holds the lock on this user's snapshot and finishes building it shortly
+    monkeypatch.setattr(snapshots, "REALTIME_SNAPSHOT_LOCK_SECONDS", 2)
+    redis = core_db.redis_client
+    redis.values[f"realtime:snapshot-lock:{me}:0"] = "1"
+    states = [{"time": "2025-01-01T00:00:00.000Z", "bac": 0.0}, {"time": "2025-01-01T00:00:00.000Z", "bac": 0.04}]
+
+    async def other_worker():
+        await asyncio.sleep(0.2)
+        redis.values[f"realtime:snapshot:{me}"] = json.dumps({"version": 0, "profile": {}, "drinks": [], "states": states})
+
+    finished = asyncio.ensure_future(other_worker())
+    r = await client.get("/realtime/initial-state", headers=headers)
+    await finished
+    assert r.json()["states"][me] == states
+
+
+@pytest.mark.anyio
+async def test_stream_reconnects_are_refused_when_admission_is_exhausted(client, monkeypatch):
+    from api.realtime import router as rt_router
+    from api.realtime.admission import StreamAdmission
+
+    admission = StreamAdmission(rate=0.01, burst=1, retry_ms=1000)
+    monkeypatch.setattr(rt_router, "stream_admission", admission)
+    assert admission.admit()
+
+    # Refused before the token is even looked at
+    r = await client.get(f"/realtime/stream/{uuid.uuid4()}", params={"token": "not-a-token"})
+    assert r.status_code == 503
+    assert int(r.headers["Retry-After"]) >= 1
+    assert admission.metrics()["rejected"] == 1
+
+
+@pytest.fixture
+def ws_client(tmp_path):
+    from starlette.testclient import TestClient
+
+    with TestClient(_app(tmp_path)) as test_client:
+        yield test_client
+
+
+def test_websocket_streams_initial_state_then_updates(ws_client):
+    from starlette.websockets import WebSocketDisconnect
+
+    user = {"email": "socket@example.com", "password": "secret", "display_name": "socket", "weight": 70,
+            "gender": "male", "height": 170, "dob": "1990-01-01", "real_dob": True}
+    assert ws_client.post("/auth/register", json=user).status_code == 201
+    token = ws_client.post(
+        "/auth/jwt/login", data={"username": user["email"], "password": user["password"]}
+    ).json()["access_token"]
+    me = ws_client.get("/auth/users/me", headers={"Authorization": f"Bearer {token}"}).json()["id"]
+
+    with ws_client.websocket_connect(f"/realtime/ws/{me}?token={token}") as websocket:
+        init = websocket.receive_json()
+        assert init["type"] == "init"
+        assert init["self"]["id"] == me
+
+        drink = {"nickname": "beer", "add_time": "2025-01-01T00:00:00Z", "volume": 500, "strength": 0.05}
+        assert ws_client.post("/drinks", json=drink, headers={"Authorization": f"Bearer {token}"}).status_code == 200
+        update = websocket.receive_json()
+        assert update["type"] == "update"
+        assert update["user_id_updated"] == me
+        assert update["eventId"] >= 1
+        # Once the update has been published, the open socket holds no pooled database connection
+        from api.core import db as core_db
+        deadline = time.monotonic() + 2
+        while core_db.engine.pool.checkedout() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert core_db.engine.pool.checkedout() == 0
+
+    # Refusals come after the handshake, so clients see the close code rather than a failed upgrade
+    with ws_client.websocket_connect(f"/realtime/ws/{me}?token=not-a-token") as websocket:
+        with pytest.raises(WebSocketDisconnect) as refused:
+            websocket.receive_json()
+    assert refused.value.code == 1008
+
+    from api.realtime import router as rt_router
+    from api.realtime.admission import StreamAdmission
+
+    rt_router.stream_admission, admission = StreamAdmission(rate=0.01, burst=1), rt_router.stream_admission
+    try:
+        rt_router.stream_admission.admit()
+        with ws_client.websocket_connect(f"/realtime/ws/{me}?token={token}") as websocket:
+            with pytest.raises(WebSocketDisconnect) as refused:
+                websocket.receive_json()
+        assert refused.value.code == 1013
+        assert refused.value.reason.startswith("Retry after")
+    finally:
+        rt_router.stream_admission = admission
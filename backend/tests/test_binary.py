@@ -0,0 +1,55 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from api.realtime.binary import decode_message, encode_event, encode_message  # noqa: E402
+
+
+STATES = [
+    {"time": "2025-01-01T00:00:00.000Z", "bac": 0.0},
+    {"time": "2025-01-01T00:00:00.000Z", "bac": 0.0512},
+    {"time": "2025-01-01T03:24:36.500Z", "bac": 0.0},
+]
+
+
+def test_update_round_trips_with_columnar_states():
+    message = {
+        "type": "update", "user_id_updated": "u1", "version": 3, "profile": {"id": "u1"},
+        "drinks": [{"id": "d1", "volume": 500, "strength": 0.05, "time": "2025-01-01 00:00:00+00:00"}],
+        "states": STATES,
+    }
+    frame = encode_event(7, json.dumps(message))
+    decoded = decode_message(frame)
+
+    assert decoded["eventId"] == 7 and decoded["version"] == 3
+    assert decoded["drinks"][0]["time"] == 1735689600000
+    assert decoded["states"]["times"].tolist() == [1735689600000, 1735689600000, 1735701876500]
+    assert np.allclose(decoded["states"]["bac"], [s["bac"] for s in STATES], atol=1e-7)
+    assert len(frame) < len(json.dumps(message))
+
+
+def test_init_carries_every_member_and_the_aggregate():
+    aggregate = {"threshold": 0.08, "times": [s["time"] for s in STATES], "max": [0, 0.05, 0], "mean": [0, 0.02, 0],
+                 "over": [0, 1, 0]}
+    message = {"type": "init", "members": [], "drinks": {}, "states": {"a": STATES, "b": []},
+               "aggregate": aggregate, "versions": {"a": 1, "b": 0}}
+    decoded = decode_message(encode_message(message))
+
+    assert len(decoded["states"]["a"]["times"]) == 3 and len(decoded["states"]["b"]["bac"]) == 0
+    assert decoded["aggregate"]["over"].tolist() == [0, 1, 0]
+    assert decoded["aggregate"]["times"][-1] == 1735701876500
+
+
+@pytest.mark.parametrize("offered, chosen", [
+    (["baptender.json.v1", "baptender.binary.v1"], "baptender.binary.v1"),
+    (["baptender.json.v1"], "baptender.json.v1"),
+    ([], None),
+])
+def test_subprotocol_negotiation(database_url, offered, chosen):
+    from api.realtime.router import choose_subprotocol
+    assert choose_subprotocol(offered) == chosen
@@ -1,6 +1,6 @@
 import os
 import sys
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 import pytest
 
@@ -10,6 +10,8 @@ from api.realtime.calculations import (
     get_bac,
     drink_to_bac,
     drinks_to_bac,
+    batch_drinks_to_bac,
+    pack_drinks,
     ALCOHOL_DENSITY,
 )
 
@@ -102,3 +104,78 @@ def test_get_total_body_water_and_widmark_factor():
     with pytest.raises(AssertionError):
         get_widmark_factor("other")
 
+
+def test_batch_drinks_to_bac_matches_reference():
+    start = datetime(2021, 9, 1, 20, 0, tzinfo=timezone.utc)
+    members = [
+        # Sober again before the third drink, so the timeline restarts
+        [
+            {"time": start, "volume": 500.0, "strength": 0.05},
+            {"time": start + timedelta(minutes=30), "volume": 50.0, "strength": 0.4},
+            {"time": start + timedelta(hours=12), "volume": 330.0, "strength": 0.05},
+        ],
+        [],
+        # Alcohol free drinks are skipped
+        [
+            {"time": start, "volume": 0.0, "strength": 0.4},
+            {"time": start + timedelta(minutes=5), "volume": 250.0, "strength": 0.12},
+            {"time": start + timedelta(minutes=5), "volume": 250.0, "strength": 0.0},
+        ],
+    ]
+    users = [
+        {"weight": 70.0, "height": 180.0, "age": 30.0, "gender": "MALE"},
+        {"weight": 60.0, "height": 165.0, "age": 25.0, "gender": "female"},
+        {"weight": 60.0, "height": None, "age": 25.0, "gender": "female"},
+    ]
+
+    results = batch_drinks_to_bac(**pack_drinks(members, users), metabolism_rate=0.015)
+
+    assert len(results) == len(members)
+    assert results[1] == []
+    for drinks, user, states in zip(members, users, results):
+        expected = drinks_to_bac(drinks, user, metabolism_rates=0.015)
+        assert len(states) == len(expected)
+        for state, ref in zip(states, expected):
+            assert pytest.approx(ref["bac"], rel=1e-9, abs=1e-12) == state["bac"]
+            assert pytest.approx(ref["time"].timestamp(), abs=1e-3) == state["time"].timestamp()
+
+
+
+def test_batch_drinks_to_bac_multiple_rates():
+    start = datetime(2021, 9, 1, 20, 0, tzinfo=timezone.utc)
+    drinks = [
+        {"time": start, "volume": 500.0, "strength": 0.05},
+        {"time": start + timedelta(hours=3), "volume": 500.0, "strength": 0.05},
+    ]
+    user = {"weight": 70.0, "height": 180.0, "age": 30.0, "gender": "MALE"}
+    rates = {"slow": 0.01, "fast": 0.03}
+
+    [results] = batch_drinks_to_bac(**pack_drinks([drinks], [user]), metabolism_rate=rates)
+    expected = drinks_to_bac(drinks, user, metabolism_rates=rates)
+
+    assert set(results) == set(rates)
+    # The fast lane sobers up between the drinks and restarts, the slow one doesn't
+    assert len(results["fast"]) == 3
+    assert len(results["slow"]) == 5
+    for label in rates:
+        assert len(results[label]) == len(expected[label])
+        for state, ref in zip(results[label], expected[label]):
+            assert pytest.approx(ref["bac"], rel=1e-9, abs=1e-12) == state["bac"]
+
+
+def test_body_profile_is_validated_and_cached():
+    from api.realtime.calculations import BodyProfile, get_body_profile
+
+    user = {"weight": 70.0, "height": 180.0, "age": 30.0, "gender": "male"}
+    profile = get_body_profile(user)
+    assert get_body_profile({**user, "gender": "MALE"}) is profile
+    assert pytest.approx(get_bac(100.0, 0.4, 70.0, "MALE", age=30.0, height=180.0), rel=1e-12) == \
+        profile.drink_bac(100.0, 0.4)
+
+    widmark = get_body_profile({**user, "height": None})
+    assert pytest.approx(get_bac(100.0, 0.4, 70.0, "MALE"), rel=1e-12) == widmark.drink_bac(100.0, 0.4)
+
+    with pytest.raises(AssertionError):
+        BodyProfile(5.0, 180.0, 30.0, "MALE")
+    with pytest.raises(AssertionError):
+        get_body_profile({**user, "gender": "other"})
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import sys
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def published(actions, monkeypatch):
+    calls = []
+
+    async def fake_update_user(user):
+        calls.append(user)
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(actions, "update_user", fake_update_user)
+    monkeypatch.setattr(actions, "REALTIME_COALESCE_WINDOW", 0.02)
+    actions.work_queue.start()
+    yield calls
+    await actions.work_queue.drain()
+
+
+@pytest.mark.anyio
+async def test_burst_is_published_once_with_latest_user(actions, published):
+    user_id = uuid.uuid4()
+    versions = [SimpleNamespace(id=user_id, version=v) for v in range(3)]
+    for user in versions:
+        actions.request_update(user)
+
+    await asyncio.sleep(0.1)
+    assert published == [versions[-1]]
+
+
+@pytest.mark.anyio
+async def test_change_during_publish_is_not_dropped(actions, published):
+    user_id = uuid.uuid4()
+    actions.request_update(SimpleNamespace(id=user_id, version=0))
+    await asyncio.sleep(0.04)  # first update is now being built
+    latest = SimpleNamespace(id=user_id, version=1)
+    actions.request_update(latest)
+
+    await asyncio.sleep(0.15)
+    assert [u.version for u in published] == [0, 1]
+    assert published[-1] is latest
+    assert actions.work_queue.metrics()["depth"] == 0
+
+
+@pytest.mark.anyio
+async def test_update_rejected_by_a_full_queue_is_published_once_there_is_room(actions, published, monkeypatch):
+    monkeypatch.setattr(actions.work_queue, "max_depth", 1)
+
+    async def other_work():
+        await asyncio.sleep(0.05)
+
+    assert actions.work_queue.submit(uuid.uuid4(), "other", other_work, delay=0.02)
+    user_id = uuid.uuid4()
+    versions = [SimpleNamespace(id=user_id, version=v) for v in range(3)]
+    for user in versions:
+        actions.request_update(user)
+    assert actions.work_queue.metrics()["rejected"] >= 3
+
+    await asyncio.sleep(0.3)
+    assert published == [versions[-1]]
+    assert not actions._deferred_updates
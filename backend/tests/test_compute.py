@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from api.core.compute import ComputePool  # noqa: E402
+from api.realtime.calculations import batch_state_payloads  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _members(n):
+    start = datetime(2025, 1, 1, 20, 0, tzinfo=timezone.utc)
+    drinks = [
+        [{"time": start + timedelta(minutes=10 * i), "volume": 330.0, "strength": 0.05} for i in range(k % 5)]
+        for k in range(n)
+    ]
+    users = [{"weight": 60.0 + k, "height": 175.0, "age": 30.0, "gender": "MALE"} for k in range(n)]
+    return drinks, users
+
+
+def _thread_names(items):
+    return [threading.current_thread().name for _ in items]
+
+
+@pytest.mark.anyio
+async def test_small_batches_stay_inline_and_large_ones_are_chunked():
+    pool = ComputePool("thread", workers=2, inline_items=3, chunk_size=4)
+    try:
+        assert set(await pool.map_chunks(_thread_names, range(3))) == {threading.current_thread().name}
+
+        names = await pool.map_chunks(_thread_names, range(10))
+        assert len(names) == 10 and all(name.startswith("compute") for name in names)
+        # Whole chunks run together
+        assert names[0:4] == [names[0]] * 4
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.anyio
+async def test_process_pool_matches_inline_results():
+    drinks, users = _members(30)
+    pool = ComputePool("process", workers=2, inline_items=5, chunk_size=8)
+    try:
+        pooled = await pool.map_chunks(batch_state_payloads, drinks, users)
+    finally:
+        pool.shutdown()
+
+    inline = batch_state_payloads(drinks, users)
+    assert len(pooled) == len(inline)
+    for pooled_states, inline_states in zip(pooled, inline):
+        assert [s["time"] for s in pooled_states] == [s["time"] for s in inline_states]
+        assert [s["bac"] for s in pooled_states] == pytest.approx([s["bac"] for s in inline_states], rel=1e-12)
+    assert pooled[0] == [] and len(pooled[4]) == 9
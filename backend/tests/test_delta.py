@@ -0,0 +1,111 @@
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from api.realtime.incremental import IncrementalBAC
+
+USER = {"weight": 70.0, "height": 180.0, "age": 30.0, "gender": "MALE"}
+START = datetime(2021, 9, 1, 20, 0, tzinfo=timezone.utc)
+PROFILE = {"id": "x", "displayName": "x"}
+
+
+def _snapshot(drinks):
+    checkpoint = IncrementalBAC(USER)
+    checkpoint.sync(drinks)
+    return {"profile": PROFILE, "drinks": drinks, "states": checkpoint.timeline().to_payload()}
+
+
+def _apply(snapshot, delta):
+    removed = set(delta["drinks_removed"])
+    upserted = {d["id"]: d for d in delta["drinks_upserted"]}
+    drinks = [upserted.pop(d["id"], d) for d in snapshot["drinks"] if d["id"] not in removed]
+    drinks = sorted(drinks + list(upserted.values()), key=lambda d: d["time"])
+
+    states = snapshot["states"]
+    if delta["states_since"] is not None:
+        states = [s for s in states if s["time"] < delta["states_since"]] + delta["states"]
+    return {"profile": snapshot["profile"], "drinks": drinks, "states": states}
+
+
+def _drinks(n):
+    return [
+        {"id": str(i), "nickname": "beer", "volume": 500.0, "strength": 0.05, "time": START + timedelta(minutes=30 * i)}
+        for i in range(n)
+    ]
+
+
+def test_appended_drink_sends_only_the_tail(actions):
+    old, new = _snapshot(_drinks(5)), _snapshot(_drinks(6))
+    delta = actions.delta_message(uuid.uuid4(), 2, old, new)
+
+    assert delta["base_version"] == 1
+    assert [d["id"] for d in delta["drinks_upserted"]] == ["5"]
+    assert delta["drinks_removed"] == []
+    assert len(delta["states"]) < len(new["states"])
+    assert _apply(old, delta) == new
+
+
+def test_edit_and_removal_round_trip(actions):
+    drinks = _drinks(6)
+    edited = [dict(d) for d in drinks[:-1]]
+    edited[2]["volume"] = 330.0
+
+    old, new = _snapshot(drinks), _snapshot(edited)
+    delta = actions.delta_message(uuid.uuid4(), 5, old, new)
+    assert [d["id"] for d in delta["drinks_upserted"]] == ["2"]
+    assert delta["drinks_removed"] == ["5"]
+    assert _apply(old, delta) == new
+
+    # Removing every drink clears the states
+    delta = actions.delta_message(uuid.uuid4(), 6, new, _snapshot([]))
+    assert _apply(new, delta) == _snapshot([])
+
+
+def test_unchanged_snapshot_is_an_empty_delta(actions):
+    snapshot = _snapshot(_drinks(3))
+    delta = actions.delta_message(uuid.uuid4(), 3, snapshot, snapshot)
+    assert delta["drinks_upserted"] == delta["drinks_removed"] == delta["states"] == []
+    assert delta["states_since"] is None
+
+
+def test_drink_moved_later_drops_the_old_states(actions):
+    drinks = _drinks(3)
+    moved = [dict(d) for d in drinks]
+    moved[0]["time"] = START + timedelta(hours=2)
+    moved.sort(key=lambda d: d["time"])
+
+    old, new = _snapshot(drinks), _snapshot(moved)
+    delta = actions.delta_message(uuid.uuid4(), 2, old, new)
+    assert delta["states_since"] == old["states"][0]["time"]
+    assert _apply(old, delta) == new
+
+
+def test_new_session_replaces_the_old_timeline(actions):
+    # The first session's drinks were archived and a drink logged the next day
+    old = _snapshot(_drinks(4))
+    new = _snapshot([{"id": "next", "nickname": "beer", "volume": 500.0, "strength": 0.05,
+                      "time": START + timedelta(days=1)}])
+
+    delta = actions.delta_message(uuid.uuid4(), 2, old, new)
+    assert delta["drinks_removed"] == ["0", "1", "2", "3"]
+    assert _apply(old, delta) == new
+
+
+def test_resampled_delta_window_takes_naive_times(actions):
+    from api.realtime.router import resample_update
+
+    old, new = _snapshot(_drinks(5)), _snapshot(_drinks(6))
+    delta = json.dumps(actions.delta_message(uuid.uuid4(), 2, old, new), default=str)
+    tail_start = datetime.fromisoformat(json.loads(delta)["states_since"].replace("Z", "+00:00"))
+
+    resampled = json.loads(resample_update(delta, {"points": 5, "start": datetime(2021, 9, 1, 19), "end": None}))
+    assert len(resampled["states"]) == 5
+    assert resampled["states"][0]["time"] == json.loads(delta)["states_since"]
+    # The whole window is before the tail, so nothing in it changed
+    window_end = (tail_start - timedelta(minutes=1)).replace(tzinfo=None)
+    options = {"points": 5, "start": datetime(2021, 9, 1, 19), "end": window_end}
+    assert json.loads(resample_update(delta, options))["states"] == []
@@ -0,0 +1,294 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+class FakePubSub:
+    def __init__(self, broker):
+        self.broker = broker
+        self.channels = set()
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+        self.broker.subscribe_calls += len(channels)
+
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        message = await asyncio.wait_for(self.messages.get(), timeout)
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+    async def aclose(self):
+        self.broker.pubsubs.remove(self)
+
+
+class FakePipeline:
+    def __init__(self, broker):
+        self.broker = broker
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def set(self, key, value, ex=None):
+        self.broker.present.add(key)
+
+    async def execute(self):
+        pass
+
+
+class FakeBroker:
+    def __init__(self):
+        self.pubsubs = []
+        self.subscribe_calls = 0
+        self.present = set()
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def pubsub(self):
+        pubsub = FakePubSub(self)
+        self.pubsubs.append(pubsub)
+        return pubsub
+
+    async def publish(self, channel, data):
+        for pubsub in self.pubsubs:
+            if channel in pubsub.channels:
+                pubsub.messages.put_nowait({"type": "message", "channel": channel, "data": data})
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def hub(database_url, monkeypatch):
+    from api.realtime import hub as hub_module, presence
+
+    broker = FakeBroker()
+    monkeypatch.setattr(hub_module, "redis_client", broker)
+    monkeypatch.setattr(presence, "redis_client", broker)
+    hub = hub_module.PubSubHub()
+    hub.broker = broker
+    yield hub
+    await hub.close()
+
+
+@pytest.mark.anyio
+async def test_connections_share_one_redis_subscription(hub):
+    connections = [hub.subscription() for _ in range(50)]
+    for connection in connections:
+        await connection.subscribe("sse:group:1")
+    await connections[0].subscribe("sse:user:0")
+
+    assert len(hub.broker.pubsubs) == 1
+    assert hub.broker.subscribe_calls == 2
+    assert hub.broker.present == {"presence:sse:group:1", "presence:sse:user:0"}
+    assert hub.metrics()["connections"] == 50
+
+    await hub.broker.publish("sse:group:1", "hello")
+    received = await asyncio.gather(*(c.get_message(timeout=1) for c in connections))
+    assert {m["data"] for m in received} == {"hello"}
+
+    await hub.broker.publish("sse:user:0", "only you")
+    assert (await connections[0].get_message(timeout=1))["data"] == "only you"
+    assert await connections[1].get_message(timeout=0.05) is None
+
+
+@pytest.mark.anyio
+async def test_channel_is_dropped_with_its_last_listener(hub):
+    a, b = hub.subscription(), hub.subscription()
+    await a.subscribe("sse:group:1")
+    await b.subscribe("sse:group:1")
+    pubsub = hub.broker.pubsubs[0]
+
+    await a.close()
+    assert pubsub.channels == {"sse:group:1"}
+    await b.unsubscribe("sse:group:1")
+    assert pubsub.channels == set()
+    assert hub.metrics()["channels"] == 0
+
+
+@pytest.mark.anyio
+async def test_relay_follows_membership_changes(hub, monkeypatch):
+    from api.realtime import router
+    monkeypatch.setattr(router, "hub", hub)
+
+    subscription = hub.subscription()
+    await subscription.subscribe("sse:me", "sse:group:old")
+    events = router.relay_messages(subscription, "sse:me")
+
+    # Recognised whatever the key order and spacing
+    await hub.broker.publish("sse:me", json.dumps({"group_id": "new", "type": "subscribe"}, separators=(",", ":")))
+    await hub.broker.publish("sse:me", '{"type": "update", "n": 1}')
+
+    # The control message moves the stream without reaching the client
+    assert (await asyncio.wait_for(anext(events), 1))["data"] == '{"type": "update", "n": 1}'
+    assert subscription.channels == {"sse:me", "sse:group:new"}
+
+    await hub.broker.publish("sse:group:old", '{"type": "update", "n": 2}')
+    await hub.broker.publish("sse:group:new", '{"type": "update", "n": 3}')
+    assert (await asyncio.wait_for(anext(events), 1))["data"] == '{"type": "update", "n": 3}'
+    await events.aclose()
+
+
+@pytest.mark.anyio
+async def test_relay_tags_events_and_skips_replayed_ones(hub):
+    from api.realtime import router
+
+    subscription = hub.subscription()
+    await subscription.subscribe("sse:me")
+    events = router.relay_messages(subscription, "sse:me", after=7)
+
+    await hub.broker.publish("sse:me", '7 {"type": "update", "n": 7}')
+    await hub.broker.publish("sse:me", '8 {"type": "update", "n": 8}')
+    assert await asyncio.wait_for(anext(events), 1) == {"id": "8", "data": '{"type": "update", "n": 8}'}
+    await events.aclose()
+
+
+@pytest.mark.anyio
+async def test_curve_is_resampled_once_per_event_for_every_connection(hub, monkeypatch):
+    from api.realtime import router
+
+    calls = []
+    resample_update = router.resample_update
+    monkeypatch.setattr(router, "resample_update", lambda *args: calls.append(args) or resample_update(*args))
+    router.resample_event.cache_clear()
+
+    curve = {"points": 3, "start": None, "end": None}
+    connections = []
+    for _ in range(20):
+        subscription = hub.subscription()
+        await subscription.subscribe("sse:group:1")
+        connections.append(router.relay_messages(subscription, "sse:me", curve))
+
+    states = [{"time": f"2025-01-01T00:{m:02d}:00Z", "bac": m / 1000} for m in range(30)]
+    await hub.broker.publish("sse:group:1", "9 " + json.dumps({"type": "update", "states": states}))
+    received = [await asyncio.wait_for(anext(events), 1) for events in connections]
+
+    assert len(calls) == 1
+    assert {len(json.loads(event["data"])["states"]) for event in received} == {3}
+    for events in connections:
+        await events.aclose()
+
+
+@pytest.mark.anyio
+async def test_group_aggregates_only_reach_streams_that_asked(hub):
+    from api.realtime import router
+
+    plain, with_aggregates = hub.subscription(), hub.subscription()
+    for subscription in (plain, with_aggregates):
+        await subscription.subscribe("sse:group:1")
+    plain_events = router.relay_messages(plain, "sse:me")
+    aggregate_events = router.relay_messages(with_aggregates, "sse:you", aggregate=True)
+
+    await hub.broker.publish("sse:group:1", '5 {"type": "group", "group_id": "1", "aggregate": {}}')
+    await hub.broker.publish("sse:group:1", '6 {"type": "update", "user_id_updated": "a"}')
+    assert (await asyncio.wait_for(anext(plain_events), 1))["id"] == "6"
+    assert [(await asyncio.wait_for(anext(aggregate_events), 1))["id"] for _ in range(2)] == ["5", "6"]
+    await plain_events.aclose()
+    await aggregate_events.aclose()
+
+
+@pytest.mark.anyio
+async def test_relayed_events_encode_as_server_sent_events(hub):
+    from sse_starlette.sse import ensure_bytes
+    from api.realtime import router
+
+    subscription = hub.subscription()
+    await subscription.subscribe("sse:me")
+    events = router.relay_messages(subscription, "sse:me")
+
+    await hub.broker.publish("sse:me", '12 {"type": "update", "n": 12}')
+    encoded = ensure_bytes(await asyncio.wait_for(anext(events), 1), "\r\n")
+    assert encoded == b'id: 12\r\ndata: {"type": "update", "n": 12}\r\n\r\n'
+    await events.aclose()
+
+
+@pytest.mark.anyio
+async def test_resync_is_flagged_rather_than_matched_by_its_text(hub, monkeypatch):
+    from api.realtime import router
+
+    async def lost(channels, last_event_id):
+        return None
+
+    monkeypatch.setattr(router, "hub", hub)
+    monkeypatch.setattr(router, "replay_events", lost)
+    events = router.stream_events("me", None, None, 3)
+
+    resync = await asyncio.wait_for(anext(events), 1)
+    assert resync["resync"] and json.loads(resync["data"]) == {"type": "resync"}
+    # A published message that happens to read the same is relayed as an ordinary event
+    await hub.broker.publish("sse:me", '4 {"type": "resync"}')
+    assert "resync" not in await asyncio.wait_for(anext(events), 1)
+    await events.aclose()
+
+
+def _update(event_id, member, n):
+    return f'{event_id} {{"type": "update", "user_id_updated": "{member}", "n": {n}}}'
+
+
+@pytest.mark.anyio
+async def test_full_buffer_keeps_only_the_latest_state_per_member(hub):
+    slow, fast = hub.subscription(), hub.subscription()
+    slow.max_size = 2
+    for subscription in (slow, fast):
+        await subscription.subscribe("sse:group:1")
+
+    await hub.broker.publish("sse:group:1", _update(1, "a", 1))
+    await hub.broker.publish("sse:group:1", _update(2, "b", 1))
+    await hub.broker.publish("sse:group:1", _update(3, "a", 2))
+    await asyncio.sleep(0.01)
+
+    received = [await slow.get_message(timeout=1) for _ in range(2)]
+    assert [m["data"] for m in received] == [_update(2, "b", 1), _update(3, "a", 2)]
+    assert await slow.get_message(timeout=0.05) is None
+    # Other connections on the channel are unaffected
+    assert [(await fast.get_message(timeout=1))["data"][0] for _ in range(3)] == ["1", "2", "3"]
+    assert hub.metrics()["coalesced"] == 1
+
+
+@pytest.mark.anyio
+async def test_stuck_consumer_is_disconnected(hub):
+    from api.realtime.hub import SlowConsumer
+
+    subscription = hub.subscription()
+    subscription.max_size = 2
+    await subscription.subscribe("sse:group:1")
+
+    for n in range(3):
+        await hub.broker.publish("sse:group:1", _update(n + 1, f"member-{n}", n))
+    await asyncio.sleep(0.01)
+
+    # Nothing in the buffer was superseded by the third message, so the connection is dropped
+    with pytest.raises(SlowConsumer):
+        await subscription.get_message(timeout=1)
+    assert hub.metrics()["slowConsumersDisconnected"] == 1
+
+
+@pytest.mark.anyio
+async def test_lost_redis_connection_disconnects_every_stream(hub):
+    from api.realtime.hub import SlowConsumer
+
+    connections = [hub.subscription() for _ in range(3)]
+    for n, connection in enumerate(connections):
+        await connection.subscribe(f"sse:{n}", "sse:group:1")
+
+    # Anything published until the hub reconnects is lost, so every stream has to catch up
+    hub.broker.pubsubs[0].messages.put_nowait(ConnectionError("connection reset"))
+    for connection in connections:
+        with pytest.raises(SlowConsumer):
+            await connection.get_message(timeout=1)
+    assert hub.metrics()["slowConsumersDisconnected"] == 3
@@ -0,0 +1,74 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from api.realtime.calculations import drinks_to_bac
+from api.realtime.incremental import IncrementalBAC, get_checkpoint
+
+USER = {"weight": 70.0, "height": 180.0, "age": 30.0, "gender": "MALE"}
+START = datetime(2021, 9, 1, 20, 0, tzinfo=timezone.utc)
+
+
+def _drink(i, minutes, volume=500.0, strength=0.05):
+    return {"id": str(i), "time": START + timedelta(minutes=minutes), "volume": volume, "strength": strength}
+
+
+def _assert_matches_reference(checkpoint, drinks):
+    expected = drinks_to_bac(sorted(drinks, key=lambda d: d["time"]), USER)
+    states = checkpoint.states()
+    assert len(states) == len(expected)
+    for state, ref in zip(states, expected):
+        assert pytest.approx(ref["bac"], rel=1e-9, abs=1e-12) == state["bac"]
+        assert pytest.approx(ref["time"].timestamp(), abs=1e-3) == state["time"].timestamp()
+
+
+def test_incremental_add_remove_update():
+    checkpoint = IncrementalBAC(USER)
+    drinks = [_drink(0, 0), _drink(1, 30), _drink(2, 90, 50.0, 0.4)]
+    for drink in drinks:
+        checkpoint.add(drink)
+    _assert_matches_reference(checkpoint, drinks)
+
+    # Back-dated insert lands between existing drinks
+    late_entry = _drink(3, 15, 330.0, 0.05)
+    checkpoint.add(late_entry)
+    drinks.append(late_entry)
+    _assert_matches_reference(checkpoint, drinks)
+
+    edited = _drink(1, 600)
+    checkpoint.update(edited)
+    drinks[1] = edited
+    _assert_matches_reference(checkpoint, drinks)
+
+    assert checkpoint.remove("0")
+    assert not checkpoint.remove("missing")
+    drinks.pop(0)
+    _assert_matches_reference(checkpoint, drinks)
+
+
+def test_incremental_sync_only_recomputes_changes():
+    checkpoint = IncrementalBAC(USER)
+    drinks = [_drink(i, 20 * i) for i in range(5)]
+    assert checkpoint.sync(drinks) == 0
+
+    drinks.append(_drink(5, 200))
+    assert checkpoint.sync(drinks) == 5
+    _assert_matches_reference(checkpoint, drinks)
+
+    drinks[2] = _drink(2, 40, 0.0, 0.4)
+    assert checkpoint.sync(drinks) == 2
+    _assert_matches_reference(checkpoint, drinks)
+
+    assert checkpoint.sync([]) == 0
+    assert checkpoint.states() == []
+    assert checkpoint.sober_time is None
+
+
+def test_get_checkpoint_resets_on_new_body_data():
+    first = get_checkpoint("user", USER)
+    assert get_checkpoint("user", dict(USER)) is first
+    assert get_checkpoint("user", {**USER, "weight": 80.0}) is not first
@@ -0,0 +1,54 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from api.core.singleflight import SingleFlight  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def build(n):
+        calls.append(n)
+        await asyncio.sleep(0.05)
+        return {"built": n}
+
+    first = asyncio.ensure_future(flights.do("group:1", build, 1))
+    await asyncio.sleep(0)
+    others = [asyncio.ensure_future(flights.do("group:1", build, n)) for n in range(2, 6)]
+    # The first caller going away doesn't stop the build the others wait on
+    first.cancel()
+
+    results = await asyncio.gather(*others)
+    assert calls == [1]
+    assert results == [{"built": 1}] * 4
+    assert flights.metrics() == {"inFlight": 0, "led": 1, "shared": 4}
+
+    assert await flights.do("group:1", build, 6) == {"built": 6}
+
+
+@pytest.mark.anyio
+async def test_followers_of_a_failed_batch_take_over():
+    flights = SingleFlight()
+    led, following = flights.claim(["a", "b"])
+    assert led == ["a", "b"] and following == {}
+
+    led2, following2 = flights.claim(["b", "c"])
+    assert led2 == ["c"] and set(following2) == {"b"}
+
+    # "b" never got a result, so its follower is told to build it itself
+    flights.settle(led, {"a": 1})
+    flights.settle(led2, {"c": 3})
+    assert await SingleFlight.follow(following2["b"]) is None
+    assert flights.metrics()["inFlight"] == 0
@@ -0,0 +1,95 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from api.realtime.calculations import drinks_to_bac
+from api.realtime.timeline import BACTimeline
+
+START = datetime(2021, 9, 1, 20, 0, tzinfo=timezone.utc)
+
+
+def _timeline():
+    drinks = [
+        {"time": START, "volume": 500.0, "strength": 0.05},
+        {"time": START + timedelta(hours=1), "volume": 100.0, "strength": 0.4},
+    ]
+    user = {"weight": 70.0, "height": 180.0, "age": 30.0, "gender": "MALE"}
+    states = drinks_to_bac(drinks, user, metabolism_rates=0.015)
+    return states, BACTimeline.from_states(states)
+
+
+def test_bac_at_interpolates_between_states():
+    states, timeline = _timeline()
+    assert len(timeline) == len(states)
+    assert timeline.bac_at(START - timedelta(minutes=1)) == 0.0
+    # Right at a drink the step up has already happened
+    assert pytest.approx(states[1]["bac"]) == timeline.bac_at(START)
+    assert pytest.approx(states[1]["bac"] - 0.015 / 2) == timeline.bac_at(START + timedelta(minutes=30))
+    assert timeline.bac_at(states[-1]["time"] + timedelta(hours=1)) == 0.0
+    times = [START, START + timedelta(minutes=30), START + timedelta(hours=3)]
+    assert timeline.bac_at_many(times).tolist() == [timeline.bac_at(t) for t in times]
+
+
+def test_peak_threshold_and_sober_time():
+    states, timeline = _timeline()
+    peak = timeline.peak()
+    assert peak["bac"] == max(s["bac"] for s in states)
+    assert peak["time"] == START + timedelta(hours=1)
+
+    crossing = timeline.time_to_threshold(0.05)
+    assert crossing > peak["time"]
+    assert pytest.approx(0.05) == timeline.bac_at(crossing)
+    assert timeline.time_to_threshold(1.0) is None
+    assert pytest.approx(states[-1]["time"].timestamp()) == timeline.sober_time().timestamp()
+
+    empty = BACTimeline.from_states([])
+    assert empty.peak() is None
+    assert empty.sober_time() is None
+    assert empty.bac_at(START) == 0.0
+
+
+def test_timeline_conversions():
+    states, timeline = _timeline()
+    for state, converted in zip(states, timeline.to_states()):
+        assert pytest.approx(state["time"].timestamp()) == converted["time"].timestamp()
+        assert state["bac"] == converted["bac"]
+
+    payload = timeline.to_payload()
+    assert payload[0] == {"time": "2021-09-01T20:00:00.000Z", "bac": 0.0}
+    assert [p["bac"] for p in payload] == [s["bac"] for s in states]
+
+
+def test_downsample_and_sample():
+    import numpy as np
+    from api.realtime.timeline import resample
+
+    times = np.arange(1000.0)
+    bacs = np.abs(np.sin(times / 50))
+    bacs[500] = 5.0
+    timeline = BACTimeline(times, bacs)
+
+    reduced = timeline.downsample(50)
+    assert len(reduced) == 50
+    assert reduced.times[0] == times[0] and reduced.times[-1] == times[-1]
+    assert reduced.peak()["bac"] == 5.0
+    assert np.all(np.diff(reduced.times) > 0)
+    assert timeline.downsample(2000) is timeline
+
+    sampled = timeline.sample(0.0, 999.0, 10)
+    assert len(sampled) == 10
+    assert sampled.bacs.tolist() == timeline.bac_at_many(sampled.times).tolist()
+
+    assert len(resample(timeline, 20)) == 20
+    window = resample(timeline, 20, start=datetime.fromtimestamp(100, timezone.utc))
+    assert window.times[0] == 100.0 and len(window) == 20
+    # Naive datetimes are UTC, and an empty window has no samples rather than descending ones
+    naive = resample(timeline, 20, start=datetime(1970, 1, 1, 0, 1, 40))
+    assert naive.times.tolist() == window.times.tolist()
+    assert len(resample(timeline, 20, start=500.0, end=400.0)) == 0
+
+    payload = reduced.to_payload()
+    assert BACTimeline.from_payload(payload).times.tolist() == reduced.times.tolist()
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from api.core.work_queue import WorkQueue
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_jobs_for_a_key_run_in_order_and_never_concurrently():
+    queue = WorkQueue(workers=4, max_depth=100)
+    queue.start()
+    log, running = [], set()
+
+    async def job(key, n):
+        assert key not in running
+        running.add(key)
+        await asyncio.sleep(0.01)
+        log.append((key, n))
+        running.discard(key)
+
+    for n in range(3):
+        for key in "ab":
+            queue.submit(key, f"job{n}", job, key, n)
+    await queue.drain()
+
+    assert [n for key, n in log if key == "a"] == [0, 1, 2]
+    assert [n for key, n in log if key == "b"] == [0, 1, 2]
+    assert queue.metrics()["completed"] == 6
+
+
+@pytest.mark.anyio
+async def test_pending_jobs_of_a_kind_take_the_latest_arguments():
+    queue = WorkQueue(workers=1, max_depth=100)
+    queue.start()
+    seen = []
+
+    async def job(value):
+        seen.append(value)
+
+    for value in range(5):
+        queue.submit("user", "update", job, value, delay=0.02)
+    await asyncio.sleep(0.05)
+
+    assert seen == [4]
+    assert queue.metrics()["coalesced"] == 4
+    await queue.drain()
+
+
+@pytest.mark.anyio
+async def test_full_queue_rejects_and_failures_are_counted():
+    queue = WorkQueue(workers=1, max_depth=2)
+
+    async def fail():
+        raise ValueError("boom")
+
+    assert queue.submit("a", "x", fail)
+    assert queue.submit("b", "x", fail)
+    assert not queue.submit("c", "x", fail)
+
+    # Work queued before the workers start still runs
+    queue.start()
+    await queue.drain()
+    metrics = queue.metrics()
+    assert (metrics["rejected"], metrics["failed"], metrics["depth"]) == (1, 2, 0)
+
+
+@pytest.mark.anyio
+async def test_drain_runs_delayed_jobs_immediately():
+    queue = WorkQueue(workers=2, max_depth=10)
+    queue.start()
+    done = asyncio.Event()
+
+    async def job():
+        done.set()
+
+    queue.submit("a", "x", job, delay=60)
+    await queue.drain(timeout=1)
+    assert done.is_set()
+
+
+@pytest.mark.anyio
+async def test_bulk_submissions_wait_for_room_instead_of_being_rejected():
+    queue = WorkQueue(workers=2, max_depth=3)
+    queue.start()
+    seen = []
+
+    async def job(n):
+        await asyncio.sleep(0.01)
+        seen.append(n)
+
+    for n in range(20):
+        await queue.submit_when_room(n, "archival", job, n)
+    await queue.drain()
+
+    assert sorted(seen) == list(range(20))
+    assert queue.metrics()["rejected"] == 0
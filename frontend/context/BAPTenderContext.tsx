@@ -81,10 +81,26 @@ export function BAPTenderProvider({ children, token }: { children: React.ReactNo
   const [rawMessage, setRawMessage] = useState<string>("");
   const eventSourceRef = useRef<EventSource | null>(null);
 
+  // Latest snapshot version applied per user, to spot missed delta messages
+  const versionsRef = useRef<{ [key: string]: number }>({});
+
   // This ref is to prevent a potential race condition where multiple events
   // might try to reconnect at the exact same time.
   const isConnectingRef = useRef<boolean>(false);
 
+  const applySnapshot = useCallback((data: any) => {
+    const { user_id_updated, profile, drinks, states } = data;
+    // Replayed events can be older than the snapshot we already hold
+    if ((versionsRef.current[user_id_updated] ?? 0) > data.version) return;
+    versionsRef.current[user_id_updated] = data.version;
+    setState((prev) => {
+      const memberExists = prev.members.some(m => m.id === user_id_updated);
+      const newMembers = memberExists ? prev.members.map(member => member.id === user_id_updated ? profile : member) : [...prev.members, profile];
+      const newState: BAPTenderState = { ...prev, self: prev.self.id === user_id_updated ? profile : prev.self, members: newMembers, drinks: { ...prev.drinks, [user_id_updated]: drinks }, states: { ...prev.states, [user_id_updated]: states } };
+      return newState;
+    });
+  }, []);
+
   const initializeConnection = useCallback(async () => {
     // If we're already in the process of connecting, don't start another one.
     if (isConnectingRef.current || !token) return;
@@ -101,31 +117,68 @@ export function BAPTenderProvider({ children, token }: { children: React.ReactNo
 
       if (!res.ok) throw new Error(`Failed to fetch initial state: ${res.status}`);
 
-      const initialState: BAPTenderState = await res.json();
-      setState(initialState);
+      const { versions, lastEventId, ...initialState } = await res.json();
+      versionsRef.current = versions ?? {};
+      setState(initialState as BAPTenderState);
       console.log("Provider: Set initial state", initialState);
 
       const selfId = initialState.self?.id;
       if (!selfId) throw new Error("Initial state is missing self.id");
 
-      const url = `/api/realtime/stream/${selfId}?token=${encodeURIComponent(token)}`;
+      // Events published after the initial state was read are replayed when the stream opens
+      const url = `/api/realtime/stream/${selfId}?token=${encodeURIComponent(token)}&last_event_id=${lastEventId ?? 0}`;
       const es = new EventSource(url);
       eventSourceRef.current = es;
 
       es.onopen = () => console.log("SSE connection opened.");
 
+      // Fetches one member's full snapshot after a version gap, rather than the whole initial state
+      const resyncMember = async (userId: string) => {
+        const snapshotRes = await fetch(`/api/realtime/snapshot/${userId}`, {
+          headers: { Authorization: `Bearer ${token}` },
+        });
+        if (!snapshotRes.ok) {
+          console.error(`Failed to resync member ${userId}: ${snapshotRes.status}`);
+          return;
+        }
+        applySnapshot(await snapshotRes.json());
+      };
+
+      const applyDelta = (data: any) => {
+        const { user_id_updated, drinks_upserted, drinks_removed, states_since, states } = data;
+        if ((versionsRef.current[user_id_updated] ?? 0) >= data.version) return;
+        if (versionsRef.current[user_id_updated] !== data.base_version) {
+          console.log(`SSE: Missed an update for ${user_id_updated}, resyncing.`);
+          resyncMember(user_id_updated);
+          return;
+        }
+        versionsRef.current[user_id_updated] = data.version;
+        setState((prev) => {
+          const changed = new Set<string>([...drinks_removed, ...drinks_upserted.map((d: DrinkType) => d.id)]);
+          const newDrinks = [...(prev.drinks[user_id_updated] || []).filter(d => !changed.has(d.id)), ...drinks_upserted]
+            .sort((a, b) => new Date(a.time).getTime() - new Date(b.time).getTime());
+          // States from states_since onwards are replaced by the recomputed tail
+          const prevStates = prev.states[user_id_updated] || [];
+          const newStates = states_since === null ? prevStates : [
+            ...prevStates.filter(s => new Date(s.time).getTime() < new Date(states_since).getTime()),
+            ...states,
+          ];
+          return { ...prev, drinks: { ...prev.drinks, [user_id_updated]: newDrinks }, states: { ...prev.states, [user_id_updated]: newStates } };
+        });
+      };
+
       es.onmessage = (event) => {
         setRawMessage(event.data);
         try {
           const data = JSON.parse(event.data);
           if (data.type === "update") {
-            const { user_id_updated, profile, drinks, states } = data;
-            setState((prev) => {
-              const memberExists = prev.members.some(m => m.id === user_id_updated);
-              const newMembers = memberExists ? prev.members.map(member => member.id === user_id_updated ? profile : member) : [...prev.members, profile];
-              const newState: BAPTenderState = { ...prev, self: prev.self.id === user_id_updated ? profile : prev.self, members: newMembers, drinks: { ...prev.drinks, [user_id_updated]: drinks }, states: { ...prev.states, [user_id_updated]: states } };
-              return newState;
-            });
+            applySnapshot(data);
+          } else if (data.type === "delta") {
+            applyDelta(data);
+          } else if (data.type === "resync") {
+            // Too far behind for the server to replay what we missed
+            console.log("SSE: Replay unavailable, reloading full state.");
+            initializeConnection();
           }
         } catch (error) {
           console.error("Error parsing SSE message:", error, "Raw data:", event.data);
@@ -136,6 +189,14 @@ export function BAPTenderProvider({ children, token }: { children: React.ReactNo
         // We no longer trigger reconnection here, we let the lifecycle events handle it.
         // This is now purely for logging unexpected errors during an active connection.
         console.error("SSE error on active stream:", err);
+        // The browser retries dropped streams itself, after the jittered delay the server sent. A refused one
+        // (e.g. a 503 while the server is admitting a reconnect storm) is closed for good, so try again later,
+        // at a random point so that clients refused together don't all come back together.
+        if (es.readyState === EventSource.CLOSED && eventSourceRef.current === es) {
+          setTimeout(() => {
+            if (eventSourceRef.current === es) initializeConnection();
+          }, 1000 + Math.random() * 4000);
+        }
       };
 
     } catch (error) {
@@ -144,7 +205,7 @@ export function BAPTenderProvider({ children, token }: { children: React.ReactNo
       // Allow new connection attempts once this one has finished (or failed).
       isConnectingRef.current = false;
     }
-  }, [token]);
+  }, [token, applySnapshot]);
 
   // Initial setup effect
   useEffect(() => {
@@ -0,0 +1,49 @@
+// Decoder for binary frames from the realtime WebSocket stream ('baptender.binary.v1' subprotocol).
+// See encode_message in backend/api/realtime/binary.py for the layout.
+
+export const REALTIME_BINARY_PROTOCOL = "baptender.binary.v1";
+
+const FORMAT_VERSION = 1;
+
+const COLUMN_TYPES = {
+  f64: Float64Array,
+  f32: Float32Array,
+  u32: Uint32Array,
+} as const;
+
+type ColumnSpec = { type: keyof typeof COLUMN_TYPES; length: number };
+
+export function decodeRealtimeFrame(buffer: ArrayBuffer): any {
+  const view = new DataView(buffer);
+  const version = view.getUint8(0);
+  if (version !== FORMAT_VERSION) throw new Error(`Unsupported realtime frame version ${version}`);
+
+  const headerLength = view.getUint32(1, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 5, headerLength)));
+
+  // Columns are 8-byte aligned, so each is a view onto the frame rather than a copy
+  const columns: ArrayLike<number>[] = [];
+  let offset = 5 + headerLength;
+  for (const spec of header.columns as ColumnSpec[]) {
+    const Column = COLUMN_TYPES[spec.type];
+    offset += (8 - (offset % 8)) % 8;
+    columns.push(new Column(buffer, offset, spec.length));
+    offset += Column.BYTES_PER_ELEMENT * spec.length;
+  }
+  delete header.columns;
+
+  const resolve = (value: any): any => {
+    if (Array.isArray(value)) return value.map(resolve);
+    if (value && typeof value === "object") {
+      if ("$col" in value) return columns[value.$col];
+      return Object.fromEntries(Object.entries(value).map(([k, v]) => [k, resolve(v)]));
+    }
+    return value;
+  };
+  return resolve(header);
+}
+
+// Columnar states back to the [{ time, bac }] shape the SSE messages use
+export function statesFromColumns(states: { times: ArrayLike<number>; bac: ArrayLike<number> }) {
+  return Array.from(states.times, (time, i) => ({ time: new Date(time).toISOString(), bac: states.bac[i] }));
+}